@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Servicio local del agente. Mantiene discordagent cargado: el modelo de Ollama
+queda en memoria, y se reutilizan las sesiones HTTP, los estilos del PDF y un
+pool de procesos ya arrancado. Los logs que recibe por HTTP se procesan en una
+cola de trabajos, con estado y progreso consultables.
+
+Uso: python3 agent_service.py --port 5055
+     curl -X POST localhost:5055/jobs -H 'Content-Type: application/json' \
+          -d '{"log_path": "/ruta/SERIAL_final.txt"}'
+     curl -X POST localhost:5055/jobs -F log=@SERIAL_final.txt -F reports=@SERIAL_reports.zip
+     curl localhost:5055/jobs/<id>
+"""
+import os
+import time
+import uuid
+import queue
+import shutil
+import zipfile
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import Blueprint, Flask, jsonify, request, send_file, url_for
+from werkzeug.utils import secure_filename
+
+import discordagent
+
+# ================= CONFIGURACIÓN =================
+SERVICE_HOST              = os.environ.get("AGENT_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT              = int(os.environ.get("AGENT_SERVICE_PORT", "5055"))
+SERVICE_WORKERS           = discordagent.BATCH_MACHINES   # máquinas procesadas a la vez
+SERVICE_UPLOAD_DIR        = os.environ.get("AGENT_UPLOAD_DIR", os.path.join(discordagent.CACHE_DIR, "uploads"))
+SERVICE_MAX_UPLOAD        = 512 * 1024 * 1024             # bytes por petición (log + zip de _reports)
+SERVICE_JOBS_KEPT         = 500                           # trabajos terminados que se siguen pudiendo consultar
+SERVICE_KEEP_ALIVE        = -1                            # el modelo no se descarga mientras viva el servicio
+# ===================================================
+
+JOB_QUEUED = "en_cola"
+JOB_RUNNING = "en_curso"
+JOB_FINISHED = ("OK", "KO", "ERROR")
+
+# Un cerrojo por serial: comprobación, guardado y encolado de una subida van juntos
+_upload_locks = {}
+_upload_locks_lock = threading.Lock()
+
+def upload_lock(serial):
+    with _upload_locks_lock:
+        return _upload_locks.setdefault(serial, threading.Lock())
+
+class JobQueue:
+    """
+    Cola de trabajos del servicio. Cada trabajo es un log; varios hilos los
+    procesan con process_log compartiendo el límite de llamadas al LLM, los
+    buckets de Discord y el pool de procesos. Un log que ya está en cola o en
+    curso no se vuelve a encolar.
+    """
+    def __init__(self, workers=SERVICE_WORKERS, concurrency=discordagent.LLM_CONCURRENCY, cpu_pool=None):
+        self.concurrency = concurrency
+        self.cpu_pool = cpu_pool
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.threads = [threading.Thread(target=self._worker, name=f"agent-job-{i}", daemon=True)
+                        for i in range(max(1, workers))]
+        for t in self.threads:
+            t.start()
+
+    def _active_for(self, log_path):
+        for job in self.jobs.values():
+            if job["log_path"] == log_path and job["status"] not in JOB_FINISHED:
+                return job
+        return None
+
+    def active(self, log_path):
+        """
+        Trabajo en cola o en curso para `log_path`, o None.
+        """
+        with self.lock:
+            job = self._active_for(os.path.realpath(log_path))
+            return self._snapshot(job) if job else None
+
+    def submit(self, log_path, resume=True):
+        """
+        Encola `log_path`. Devuelve (trabajo, nuevo); si el log ya estaba en cola
+        o en curso se devuelve ese trabajo con nuevo=False.
+        """
+        log_path = os.path.realpath(log_path)
+        with self.lock:
+            job = self._active_for(log_path)
+            if job:
+                return self._snapshot(job), False
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "log_path": log_path,
+                "serial": discordagent.serial_from_log_path(log_path),
+                "resume": resume,
+                "status": JOB_QUEUED,
+                "stage": None,
+                "done": 0,
+                "total": 0,
+                "submitted": time.time(),
+                "started": None,
+                "finished": None,
+                "elapsed": None,
+                "error": None,
+            }
+            self.jobs[job["id"]] = job
+            self._prune()
+            self.pending.put(job["id"])
+            return self._snapshot(job), True
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def list(self, status=None):
+        with self.lock:
+            return [self._snapshot(j) for j in reversed(self.jobs.values())
+                    if status is None or j["status"] == status]
+
+    def counts(self):
+        with self.lock:
+            out = {}
+            for job in self.jobs.values():
+                out[job["status"]] = out.get(job["status"], 0) + 1
+            return out
+
+    def _snapshot(self, job):
+        snap = dict(job)
+        if job["status"] == JOB_QUEUED:
+            snap["position"] = sum(1 for j in self.jobs.values()
+                                   if j["status"] == JOB_QUEUED and j["submitted"] <= job["submitted"])
+        return snap
+
+    def _prune(self):
+        finished = [j["id"] for j in self.jobs.values() if j["status"] in JOB_FINISHED]
+        for job_id in finished[:max(0, len(finished) - SERVICE_JOBS_KEPT)]:
+            del self.jobs[job_id]
+
+    def _progress(self, job):
+        def on_progress(stage, done, total):
+            with self.lock:
+                job["stage"] = stage
+                if total:
+                    job.update(done=done, total=total)
+        return on_progress
+
+    def _worker(self):
+        while True:
+            job_id = self.pending.get()
+            if job_id is None:
+                return
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                job.update(status=JOB_RUNNING, started=time.time())
+            try:
+                summary = discordagent.process_log(job["log_path"], self.concurrency, self.cpu_pool,
+                                                   job["resume"], on_progress=self._progress(job))
+                status, error = summary["status"], None
+            except Exception as e:
+                print(f"Error procesando {job['log_path']}:", e)
+                status, error = "ERROR", str(e)
+            with self.lock:
+                job.update(status=status, error=error, stage="terminado", finished=time.time(),
+                           elapsed=round(time.time() - job["started"], 3))
+            print(f"[{status}] {job['serial']} ({job['elapsed']:.1f} s)")
+
+    def close(self):
+        for _ in self.threads:
+            self.pending.put(None)
+
+def save_upload(log_file, reports_zip=None, upload_dir=None):
+    """
+    Guarda un log subido en `upload_dir/<serial>/` y, si se adjunta, extrae el
+    zip de la carpeta _reports a su lado. La misma máquina usa siempre la misma
+    carpeta, así el diario permite reanudar. El zip se valida y extrae antes de
+    tocar nada: si falla, el log y los reports anteriores siguen intactos.
+    Devuelve la ruta del log.
+    """
+    upload_dir = upload_dir or SERVICE_UPLOAD_DIR
+    name = secure_filename(log_file.filename or "")
+    if not name.endswith("_final.txt"):
+        raise ValueError("el log debe llamarse <serial>_final.txt")
+    serial = discordagent.serial_from_log_path(name)
+    machine_dir = os.path.join(upload_dir, serial)
+    os.makedirs(machine_dir, exist_ok=True)
+    log_path = os.path.join(machine_dir, name)
+    reports_dir = os.path.join(machine_dir, f"{serial}_reports")
+    reports_tmp = None
+    if reports_zip is not None and reports_zip.filename:
+        reports_tmp = extract_reports(reports_zip, reports_dir)
+    tmp = f"{log_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        log_file.save(tmp)
+    except OSError:
+        if reports_tmp:
+            shutil.rmtree(reports_tmp, ignore_errors=True)
+        raise
+    os.replace(tmp, log_path)
+    if reports_tmp:
+        install_reports(reports_tmp, reports_dir)
+    return log_path
+
+def extract_reports(stream, reports_dir):
+    """
+    Extrae el zip de _reports en una carpeta temporal junto a `reports_dir` y
+    devuelve su ruta. Todas las rutas se comprueban antes de extraer nada.
+    Admite el zip de la carpeta (<serial>_reports/...) o solo de su contenido.
+    """
+    prefix = os.path.basename(reports_dir) + "/"
+    try:
+        with zipfile.ZipFile(stream) as zf:
+            members = [m for m in zf.infolist() if not m.is_dir()]
+            if members and all(m.filename.startswith(prefix) for m in members):
+                for m in members:
+                    m.filename = m.filename[len(prefix):]
+            root = os.path.realpath(reports_dir)
+            for m in members:
+                target = os.path.realpath(os.path.join(root, m.filename))
+                if not target.startswith(root + os.sep):
+                    raise ValueError(f"ruta no válida en el zip: {m.filename}")
+            tmp = tempfile.mkdtemp(prefix=f".{os.path.basename(reports_dir)}.", dir=os.path.dirname(root))
+            try:
+                for m in members:
+                    zf.extract(m, tmp)
+            except Exception:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+            return tmp
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"el fichero de reports no es un zip válido: {e}")
+
+def install_reports(tmp_dir, reports_dir):
+    """
+    Sustituye `reports_dir` por la carpeta ya extraída con dos renombrados.
+    """
+    old = None
+    if os.path.exists(reports_dir):
+        old = f"{reports_dir}.{os.getpid()}.{threading.get_ident()}.old"
+        os.replace(reports_dir, old)
+    os.replace(tmp_dir, reports_dir)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+
+def create_blueprint(jobs, model_state):
+    """
+    Rutas del servicio. Se pueden registrar también en la interfaz web de AzkenOS
+    con app.register_blueprint(create_blueprint(...), url_prefix="/agent").
+    """
+    bp = Blueprint("agent", __name__)
+
+    def job_response(job, code):
+        resp = jsonify(job)
+        resp.status_code = code
+        resp.headers["Location"] = url_for("agent.get_job", job_id=job["id"])
+        return resp
+
+    @bp.get("/health")
+    def health():
+        return jsonify({
+            "status": "ok",
+            "model": discordagent.MODEL_NAME,
+            "triage_model": discordagent.TRIAGE_MODEL or None,
+            "model_loaded": model_state["loaded"],
+            "workers": len(jobs.threads),
+            "jobs": jobs.counts(),
+        })
+
+    @bp.post("/jobs")
+    def submit_job():
+        if request.files:
+            if "log" not in request.files:
+                return jsonify({"error": "falta el fichero 'log'"}), 400
+            resume = request.form.get("fresh", "").lower() not in ("1", "true", "yes", "si", "sí")
+            name = secure_filename(request.files["log"].filename or "")
+            serial = discordagent.serial_from_log_path(name)
+            with upload_lock(serial):
+                # Igual que con log_path: se devuelve el trabajo existente sin tocar sus ficheros
+                job = jobs.active(os.path.join(SERVICE_UPLOAD_DIR, serial, name))
+                if job:
+                    return job_response(job, 200)
+                try:
+                    log_path = save_upload(request.files["log"], request.files.get("reports"))
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+                job, created = jobs.submit(log_path, resume)
+            return job_response(job, 202 if created else 200)
+        else:
+            data = request.get_json(silent=True) or {}
+            log_path = data.get("log_path")
+            resume = not data.get("fresh", False)
+            if not log_path:
+                return jsonify({"error": "indica 'log_path' o sube el fichero 'log'"}), 400
+            if not os.path.isfile(log_path):
+                return jsonify({"error": f"no existe '{log_path}'"}), 404
+        job, created = jobs.submit(log_path, resume)
+        return job_response(job, 202 if created else 200)
+
+    @bp.get("/jobs")
+    def list_jobs():
+        return jsonify(jobs.list(request.args.get("status")))
+
+    @bp.get("/jobs/<job_id>")
+    def get_job(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "trabajo no encontrado"}), 404
+        return jsonify(job)
+
+    @bp.get("/jobs/<job_id>/report")
+    def get_report(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "trabajo no encontrado"}), 404
+        pdf_path = os.path.join(os.path.dirname(job["log_path"]), f"{job['serial']}_informe.pdf")
+        if job["status"] not in JOB_FINISHED or not os.path.isfile(pdf_path):
+            return jsonify({"error": "el informe aún no está disponible", "status": job["status"]}), 409
+        return send_file(pdf_path, mimetype="application/pdf", as_attachment=True,
+                         download_name=os.path.basename(pdf_path))
+
+    return bp
+
+def create_app(jobs, model_state):
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = SERVICE_MAX_UPLOAD
+    app.register_blueprint(create_blueprint(jobs, model_state))
+    return app
+
+def warm_up(model_state):
+    """
+    Carga los modelos en Ollama sin bloquear el arranque del servidor HTTP.
+    """
+    model_state["loaded"] = discordagent.preload_models()
+    print("Modelo cargado en Ollama." if model_state["loaded"] else "El modelo se cargará con el primer trabajo.")
+
+def start_cpu_pool(workers=None):
+    """
+    Pool de procesos para parseo y PDF. Se arrancan todos los procesos antes de
+    crear hilos (fork desde un proceso con hilos no es seguro); cada uno hereda
+    discordagent ya importado, con ReportLab y los estilos del PDF listos.
+    """
+    workers = workers or os.cpu_count() or 1
+    cpu_pool = ProcessPoolExecutor(max_workers=workers)
+    list(cpu_pool.map(time.sleep, [0.05] * workers))
+    return cpu_pool
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP del agente con cola de trabajos.")
+    parser.add_argument("--host", default=SERVICE_HOST, help=f"dirección de escucha (por defecto {SERVICE_HOST})")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help=f"puerto (por defecto {SERVICE_PORT})")
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS,
+                        help=f"máquinas procesadas a la vez (por defecto {SERVICE_WORKERS})")
+    parser.add_argument("--concurrency", type=int, default=discordagent.LLM_CONCURRENCY,
+                        help="llamadas simultáneas al LLM entre todos los trabajos")
+    parser.add_argument("--triage-model", metavar="MODELO", default=discordagent.TRIAGE_MODEL,
+                        help="activa la cascada de modelos (ver discordagent.py --help)")
+    parser.add_argument("--no-cache", action="store_true", help="ignora la caché de análisis")
+    parser.add_argument("--no-history", action="store_true", help="no usa el histórico de la flota")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    discordagent._cache_enabled = not args.no_cache
+    discordagent._history_enabled = not args.no_history
+    discordagent.TRIAGE_MODEL = args.triage_model
+    discordagent.OLLAMA_KEEP_ALIVE = SERVICE_KEEP_ALIVE
+    discordagent._llm_slots = threading.BoundedSemaphore(max(1, args.concurrency))
+
+    cpu_pool = start_cpu_pool()
+    jobs = JobQueue(args.workers, args.concurrency, cpu_pool)
+    model_state = {"loaded": False}
+    threading.Thread(target=warm_up, args=(model_state,), daemon=True).start()
+    app = create_app(jobs, model_state)
+    print(f"Servicio del agente en http://{args.host}:{args.port} ({args.workers} trabajos a la vez)")
+    try:
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        jobs.close()
+        cpu_pool.shutdown(cancel_futures=True)
+
+if __name__ == "__main__":
+    main()
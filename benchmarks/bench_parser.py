@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Compara el separador de secciones actual con la versión anterior
+(13 re.search por línea y concatenación con +=) sobre logs sintéticos grandes.
+Antes comprueba que las tres versiones coinciden en un log con \\x0c, U+2028
+y \\r delante de algunos marcadores.
+
+Uso: python3 benchmarks/bench_parser.py --size-mb 1 5
+     python3 benchmarks/bench_parser.py --size-mb 200 --skip-legacy
+"""
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import discordagent
+
+def legacy_parse_log_sections(log_content):
+    benchmarks = {
+        "Configuracion":   r"(?i)se van a ejecutar los siguientes scripts en secuencia",
+        "Valores":         r"Estadísticas del sistema",
+        "Gobernador":      r"Ejecutando Gobernador",
+        "Octane":          r"Ejecutando Octane",
+        "GeekbenchGPU":    r"Prueba en la GPU",
+        "Anchobanda":      r"Ejecutando STREAM Benchmark",
+        "Mprime":          r"Ejecutando Mprime",
+        "Geekbench":       r"Ejecutando Geekbench",
+        "GPU-BURN":        r"Ejecutando GPU-BURN",
+        "FIO":             r"Ejecutando FIO",
+        "Sectores":        r"Ejecutando Sectores",
+        "Resultado":       r"Ejecutando Resultado",
+        "Comprobaciones":  r"Ejecutando Comprobaciones"
+    }
+    sections = {k: "" for k in benchmarks}
+    current = None
+    for line in log_content.splitlines():
+        for b, pat in benchmarks.items():
+            if re.search(pat, line):
+                current = b
+                sections[b] += line + "\n"
+                break
+        else:
+            if current:
+                sections[current] += line + "\n"
+    return sections
+
+def build_synthetic_log(path, size_mb):
+    """
+    Concatena los logs de ejemplo del repositorio hasta alcanzar `size_mb`,
+    como las capturas de consola de un burn-in largo.
+    """
+    samples = []
+    for p in sorted(glob.glob(os.path.join(REPO_DIR, "AzkenOS Keepcoding*", "*_final.txt"))):
+        with open(p, "rb") as f:
+            samples.append(f.read())
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "wb") as f:
+        while written < target:
+            for sample in samples:
+                f.write(sample)
+                written += len(sample)
+
+def build_separator_log(path):
+    """
+    Log de ejemplo con \\x0c, U+2028 y \\r justo antes de algunos marcadores:
+    str.splitlines() los trata como saltos de línea y los tres separadores
+    tienen que cortar las secciones en el mismo sitio.
+    """
+    with open(sorted(glob.glob(os.path.join(REPO_DIR, "AzkenOS Keepcoding*", "*_final.txt")))[0],
+              "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    for sep, marker in (("\x0c", "Ejecutando GPU-BURN"), ("\u2028", "Ejecutando FIO"),
+                        ("\r", "Ejecutando Mprime"), ("\x0c", "Prueba en la GPU")):
+        text = text.replace(marker, f"ruido previo{sep}{marker}", 1)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+def check_separators(tmp):
+    path = os.path.join(tmp, "separators_final.txt")
+    build_separator_log(path)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        content = f.read()
+    old = legacy_parse_log_sections(content)
+    assert discordagent.parse_log_sections(content) == old, "parse_log_sections difiere con \\x0c/U+2028"
+    assert discordagent.load_log_sections(path) == old, "load_log_sections difiere con \\x0c/U+2028"
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--skip-legacy", action="store_true",
+                        help="no ejecuta la versión anterior (muy lenta en logs grandes)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "bench_final.txt")
+        check_separators(tmp)
+        print(f"{'MB':>6} {'anterior (s)':>13} {'str (s)':>9} {'mmap (s)':>9} {'mejora':>8}")
+        for size in args.size_mb:
+            build_synthetic_log(log_path, size)
+            with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+            new, t_str = timed(discordagent.parse_log_sections, content)
+            mapped, t_mmap = timed(discordagent.load_log_sections, log_path)
+            del content
+            assert new == mapped, "parse_log_sections y load_log_sections difieren"
+            if args.skip_legacy:
+                print(f"{size:>6} {'-':>13} {t_str:>9.3f} {t_mmap:>9.3f} {'-':>8}")
+                continue
+
+            def legacy():
+                with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+                    return legacy_parse_log_sections(f.read())
+            old, t_old = timed(legacy)
+            assert old == new, "el resultado no coincide con la versión anterior"
+            print(f"{size:>6} {t_old:>13.3f} {t_str:>9.3f} {t_mmap:>9.3f} {t_old / t_mmap:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
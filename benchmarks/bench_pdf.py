@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Compara generate_pdf_report con la versión anterior (estilos y plantilla
+creados en cada llamada, un Paragraph por línea y multiBuild para el índice).
+
+Uso: python3 benchmarks/bench_pdf.py --reports 20 --lines 60 200
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+from xml.sax.saxutils import escape
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import discordagent
+from discordagent import (
+    A4, cm, colors, getSampleStyleSheet, ParagraphStyle,
+    BaseDocTemplate, Frame, PageTemplate, Paragraph, Spacer, PageBreak,
+)
+from reportlab.platypus.tableofcontents import TableOfContents
+
+def legacy_generate_pdf_report(serial, analyses, verdicts, output_dir=""):
+    pdf_filename = os.path.join(output_dir, f"{serial}_informe.pdf")
+
+    class MyDocTemplate(BaseDocTemplate):
+        def __init__(self, filename, **kw):
+            super().__init__(filename, pagesize=A4, **kw)
+            frame = Frame(self.leftMargin, self.bottomMargin,
+                          self.width, self.height, id='normal')
+            tpl = PageTemplate(id='normal', frames=[frame],
+                               onPage=self._header_footer)
+            self.addPageTemplates([tpl])
+
+        def afterFlowable(self, flowable):
+            if isinstance(flowable, Paragraph) and flowable.style.name in ('HeadingOK','HeadingError'):
+                text = flowable.getPlainText()
+                self.notify('TOCEntry', (0, text, self.page))
+                key = text.replace(' ', '_')
+                self.canv.bookmarkPage(key)
+                self.canv.addOutlineEntry(text, key, level=0, closed=False)
+
+        def _header_footer(self, canvas, doc):
+            canvas.setFont('Helvetica', 9)
+            canvas.drawRightString(A4[0] - doc.rightMargin, doc.bottomMargin - 0.5*cm,
+                                   f"Página {canvas.getPageNumber()} | {serial}")
+
+    doc = MyDocTemplate(pdf_filename)
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='TitleCenter', parent=styles['Title'], alignment=1,
+                              textColor=colors.HexColor('#2E4053'), spaceAfter=12))
+    base_h1 = styles['Heading1']
+    base_h1.fontSize, base_h1.leading, base_h1.spaceBefore, base_h1.spaceAfter = 16, 20, 12, 6
+    styles.add(ParagraphStyle(name='HeadingOK', parent=base_h1, textColor=colors.green))
+    styles.add(ParagraphStyle(name='HeadingError', parent=base_h1, textColor=colors.red))
+    normal = styles['Normal']
+    normal.fontSize, normal.leading, normal.spaceAfter = 11, 14, 4
+
+    story = [Spacer(1, 2*cm), Paragraph(f"Informe de Benchmark: {serial}", styles['TitleCenter']),
+             Spacer(1, 0.5*cm), Paragraph(f"Máquina: {serial}", normal),
+             Paragraph(f"Fecha de generación: {time.strftime('%Y-%m-%d %H:%M:%S')}", normal),
+             PageBreak(), Paragraph("Índice de contenido", styles['Heading1'])]
+    toc = TableOfContents()
+    toc.levelStyles = [ParagraphStyle(fontSize=12, name='TOCLevel1',
+                                      leftIndent=20, firstLineIndent=-20, spaceBefore=5)]
+    story += [toc, PageBreak()]
+    for bench, analysis in analyses.items():
+        style_name = 'HeadingError' if verdicts[bench] else 'HeadingOK'
+        story.append(Paragraph(bench, styles[style_name]))
+        story.append(Spacer(1, 0.2*cm))
+        for line in analysis.splitlines():
+            story.append(Paragraph(line, normal))
+        story.append(Spacer(1, 0.5*cm))
+    doc.multiBuild(story)
+    return pdf_filename
+
+def sample_analyses(max_lines):
+    """
+    Usa las secciones de los logs de ejemplo, recortadas a `max_lines` líneas,
+    como análisis de tamaño realista.
+    """
+    reports = []
+    for p in sorted(glob.glob(os.path.join(REPO_DIR, "AzkenOS Keepcoding*", "*_final.txt"))):
+        sections = discordagent.load_log_sections(p)
+        reports.append({b: "\n".join(t.splitlines()[:max_lines]) for b, t in sections.items() if t.strip()})
+    return reports
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reports", type=int, default=20, help="informes generados por medida")
+    parser.add_argument("--lines", type=int, nargs="+", default=[60, 200],
+                        help="líneas máximas por análisis")
+    args = parser.parse_args()
+
+    print(f"{'líneas':>6} {'anterior (s/inf)':>17} {'actual (s/inf)':>15} {'mejora':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for lines in args.lines:
+            reports = sample_analyses(lines)
+            # La versión anterior no escapa el texto: se le pasa ya escapado para que no falle
+            legacy_reports = [{b: escape(t) for b, t in r.items()} for r in reports]
+            t_old = t_new = 0.0
+            for i in range(args.reports):
+                k = i % len(reports)
+                verdicts = {b: len(t) % 2 == 0 for b, t in reports[k].items()}
+                t_old += timed(legacy_generate_pdf_report, f"old{i}", legacy_reports[k], verdicts, tmp)
+                t_new += timed(discordagent.generate_pdf_report, f"new{i}", reports[k], verdicts, tmp)
+            t_old /= args.reports
+            t_new /= args.reports
+            print(f"{lines:>6} {t_old:>17.3f} {t_new:>15.3f} {t_old / t_new:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
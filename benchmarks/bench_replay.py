@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Reproduce los tres logs de ejemplo del repositorio de principio a fin contra
+un LLM simulado (API de Ollama) y un servidor falso de Discord, ambos locales,
+y muestra dónde se va el tiempo de cada ejecución. No necesita red ni GPU.
+
+Uso: python3 benchmarks/bench_replay.py --repeat 3
+     python3 benchmarks/bench_replay.py --llm-tps 40 --discord-rate 5 --profile replay.prom
+     python3 benchmarks/bench_replay.py --batch
+     python3 benchmarks/bench_replay.py --llm-tps 40 --verdicts text
+     python3 benchmarks/bench_replay.py --llm-tps 40 --triage-model qwen2.5:0.5b
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import discordagent
+
+STUB_ANALYSIS = (
+    "Resumen de la sección: los valores extraídos del log están dentro de lo esperado "
+    "para esta configuración y no se observan errores ni reinicios durante la prueba. "
+)
+
+class StubOllama(BaseHTTPRequestHandler):
+    """
+    /api/generate en streaming: responde OK a las preguntas de veredicto y un
+    análisis fijo de `tokens` palabras al resto, a `tps` tokens por segundo.
+    Con format="json" devuelve un veredicto estructurado; el modelo de triaje
+    escribe un resumen corto y marca como ANOMALIA una fracción `suspicious`.
+    """
+    tokens = 200
+    tps = 0.0
+    suspicious = 0.0
+    rng = random.Random(0)
+    calls = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        prompt = body.get("prompt")
+        if prompt is None:  # precarga del modelo
+            self.wfile.write(b'{"done": true}\n')
+            return
+        with StubOllama.lock:
+            StubOllama.calls += 1
+        if "Responde SOLO con ANOMALIA o OK" in prompt:
+            words = ["OK"]
+        elif body.get("format") == "json":
+            triage = body.get("model") != discordagent.MODEL_NAME
+            with StubOllama.lock:
+                verdict = "ANOMALIA" if triage and StubOllama.rng.random() < self.suspicious else "OK"
+            n = self.tokens // 10 if triage else self.tokens
+            narrative = " ".join((STUB_ANALYSIS.split() * (n // 20 + 1))[:n])
+            obj = {"verdict": verdict, "severity": "ninguna", "values": {"Copy": "1000 MB/s"},
+                   "narrative": narrative}
+            words = json.dumps(obj, ensure_ascii=False).split(" ")
+        else:
+            words = (STUB_ANALYSIS.split() * (self.tokens // 20 + 1))[:self.tokens]
+        t0 = time.perf_counter()
+        for w in words:
+            if self.tps:
+                time.sleep(1.0 / self.tps)
+            self.wfile.write(json.dumps({"response": w + " ", "done": False}).encode() + b"\n")
+        final = {"response": "", "done": True, "eval_count": len(words),
+                 "eval_duration": int(max(time.perf_counter() - t0, 1e-6) * 1e9),
+                 "prompt_eval_count": len(prompt) // 4, "prompt_eval_duration": 1000000}
+        self.wfile.write(json.dumps(final).encode() + b"\n")
+
+class FakeDiscord(BaseHTTPRequestHandler):
+    """
+    Hilos y mensajes de Discord con cabeceras X-RateLimit-* por ruta (`rate`
+    peticiones por segundo) y una fracción `p429` de respuestas 429.
+    """
+    rate = 50
+    p429 = 0.0
+    rng = random.Random(0)
+    buckets = {}
+    counts = {"threads": 0, "messages": 0, "files": 0, "429": 0}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, obj, headers=()):
+        data = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        now = time.monotonic()
+        with FakeDiscord.lock:
+            window_start, used = FakeDiscord.buckets.get(self.path, (now, 0))
+            if now - window_start >= 1.0:
+                window_start, used = now, 0
+            limited = used >= self.rate or FakeDiscord.rng.random() < self.p429
+            if not limited:
+                used += 1
+            FakeDiscord.buckets[self.path] = (window_start, used)
+            reset_after = max(0.0, 1.0 - (now - window_start))
+            if limited:
+                FakeDiscord.counts["429"] += 1
+            elif self.path.endswith("/threads"):
+                FakeDiscord.counts["threads"] += 1
+            elif self.headers.get("Content-Type", "").startswith("multipart/"):
+                FakeDiscord.counts["files"] += 1
+            else:
+                FakeDiscord.counts["messages"] += 1
+            n = sum(FakeDiscord.counts.values())
+        if limited:
+            return self._reply(429, {"message": "You are being rate limited.",
+                                     "retry_after": round(reset_after or 0.05, 3), "global": False})
+        headers = [("X-RateLimit-Remaining", str(self.rate - used)),
+                   ("X-RateLimit-Reset-After", f"{reset_after:.3f}")]
+        self._reply(200, {"id": str(n)}, headers)
+
+def start_server(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def copy_samples(dst):
+    """
+    Copia las carpetas "AzkenOS Keepcoding*" (log y _reports) para que los PDF
+    y diarios no se escriban en el repositorio.
+    """
+    for name in sorted(os.listdir(REPO_DIR)):
+        if name.startswith("AzkenOS Keepcoding"):
+            shutil.copytree(os.path.join(REPO_DIR, name), os.path.join(dst, name),
+                            ignore=shutil.ignore_patterns("*_informe.pdf", "*_journal.json"))
+    return [log for log, _ in discordagent.find_fleet_logs(dst)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="repeticiones de cada log")
+    parser.add_argument("--concurrency", type=int, default=discordagent.LLM_CONCURRENCY)
+    parser.add_argument("--batch", action="store_true", help="procesa los tres logs a la vez con run_batch")
+    parser.add_argument("--llm-tokens", type=int, default=200, help="palabras de cada análisis simulado")
+    parser.add_argument("--llm-tps", type=float, default=0.0,
+                        help="tokens por segundo del LLM simulado (0 = sin espera)")
+    parser.add_argument("--verdicts", choices=["json", "text"], default="json",
+                        help="veredicto en la misma llamada (json) o con is_abnormal aparte (text)")
+    parser.add_argument("--triage-model", default="", help="activa la cascada con este modelo de triaje")
+    parser.add_argument("--suspicious", type=float, default=0.2,
+                        help="fracción de secciones que el triaje simulado marca como sospechosas")
+    parser.add_argument("--discord-rate", type=int, default=50, help="peticiones por segundo y ruta")
+    parser.add_argument("--discord-429", type=float, default=0.0, help="fracción de respuestas 429 inyectadas")
+    parser.add_argument("--rules", action=argparse.BooleanOptionalAction, default=True,
+                        help="usa las reglas numéricas (--no-rules manda todas las secciones al LLM)")
+    parser.add_argument("--profile", metavar="FICHERO", help="guarda las métricas (JSON o .prom)")
+    args = parser.parse_args()
+
+    StubOllama.tokens, StubOllama.tps = args.llm_tokens, args.llm_tps
+    StubOllama.suspicious = args.suspicious
+    FakeDiscord.rate, FakeDiscord.p429 = args.discord_rate, args.discord_429
+    llm, discord = start_server(StubOllama), start_server(FakeDiscord)
+    discordagent.OLLAMA_API_URL = f"http://127.0.0.1:{llm.server_port}"
+    discordagent.API_BASE_URL = f"http://127.0.0.1:{discord.server_port}/api"
+    discordagent.USE_NUMERIC_RULES = args.rules
+    discordagent.USE_JSON_VERDICTS = args.verdicts == "json"
+    discordagent.TRIAGE_MODEL = args.triage_model
+    discordagent._cache_enabled = False
+    history_dir = tempfile.TemporaryDirectory()
+    discordagent.HISTORY_DB_PATH = os.path.join(history_dir.name, "history.sqlite3")
+    discordagent._llm_slots = threading.BoundedSemaphore(max(1, args.concurrency))
+    discordagent._profiler = profiler = discordagent.Profiler()
+
+    wall = {}
+    for i in range(args.repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            logs = copy_samples(tmp)
+            if args.batch:
+                t0 = time.perf_counter()
+                discordagent.run_batch(tmp, args.concurrency, resume=False)
+                wall.setdefault("(flota)", []).append(time.perf_counter() - t0)
+                continue
+            for log in logs:
+                t0 = time.perf_counter()
+                summary = discordagent.process_log(log, args.concurrency, resume=False)
+                wall.setdefault(summary["serial"], []).append(time.perf_counter() - t0)
+
+    print(f"\n{'log':<24} {'mediana (s)':>12} {'mín (s)':>9}")
+    for serial, times in wall.items():
+        print(f"{serial:<24} {statistics.median(times):>12.3f} {min(times):>9.3f}")
+    print(f"\n{'etapa':<16} {'spans':>6} {'total (s)':>10} {'máx (s)':>9}")
+    for stage, st in sorted(profiler.summary().items(), key=lambda x: -x[1]["seconds"]):
+        print(f"{stage:<16} {st['count']:>6} {st['seconds']:>10.3f} {st['max']:>9.3f}")
+    llm_spans = [sp for sp in profiler.spans if sp["stage"] == "llm" and sp.get("eval_seconds")]
+    if llm_spans:
+        tps = sum(sp["eval_count"] for sp in llm_spans) / sum(sp["eval_seconds"] for sp in llm_spans)
+        print(f"\nLLM: {len(llm_spans)} llamadas, {tps:.0f} tokens/s, "
+              f"{sum(sp['prompt_chars'] for sp in llm_spans)} caracteres de prompt")
+    print("Discord:", ", ".join(f"{k}={v}" for k, v in FakeDiscord.counts.items()))
+    if args.profile:
+        profiler.write(args.profile)
+        print(f"Métricas guardadas en {args.profile}")
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,17 @@ import requests
 import glob
 import time
 import socket
+import json
+import csv
+import sqlite3
+import mmap
+import hashlib
+import heapq
+import argparse
+import contextlib
+import threading
+from xml.sax.saxutils import escape
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 # === ADICIÓN PDF: import ReportLab ===
 # Requiere instalar: pip install reportlab
@@ -14,24 +25,58 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import (
     BaseDocTemplate, Frame, PageTemplate,
-    Paragraph, Spacer, PageBreak
+    Paragraph, Spacer, PageBreak, Flowable, Table, TableStyle
 )
-from reportlab.platypus.tableofcontents import TableOfContents
 from reportlab.lib import colors
 from reportlab.lib.units import cm
 
-# ================= CONFIGURACIÓN =================
-# Buscar automáticamente el archivo de log final que cumpla "*_final.txt"
-log_files = glob.glob("*_final.txt")
-if not log_files:
-    print("No se encontró ningún archivo de log final.")
-    sys.exit(1)
-if len(log_files) > 1:
-    print("Se encontraron varios archivos de log final; se usará el primero:", log_files[0])
-LOG_FILE_PATH = log_files[0]
+# Requiere instalar: pip install numpy
+import numpy as np
 
+# ================= CONFIGURACIÓN =================
 # Usar el modelo qwen2.5
 MODEL_NAME = "qwen2.5"
+# Configuración de la API HTTP de Ollama (si no responde se usa `ollama run`)
+OLLAMA_API_URL            = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+OLLAMA_KEEP_ALIVE         = "30m"       # tiempo que el modelo queda cargado en memoria
+OLLAMA_CONNECT_TIMEOUT    = 5           # segundos
+OLLAMA_READ_TIMEOUT       = 600         # segundos entre tokens recibidos
+OLLAMA_RETRIES            = 2           # reintentos ante errores de red o 5xx
+OLLAMA_API_COOLDOWN       = 60          # segundos usando `ollama run` antes de volver a probar la API
+USE_OLLAMA_API            = True
+# Análisis y veredicto en una sola generación JSON (False: texto libre + is_abnormal)
+USE_JSON_VERDICTS         = True
+# Modelo pequeño que revisa antes cada sección; solo las sospechosas pasan a MODEL_NAME (vacío = sin cascada)
+TRIAGE_MODEL              = os.environ.get("AGENT_TRIAGE_MODEL", "")
+# Secciones analizadas en paralelo; debe coincidir con OLLAMA_NUM_PARALLEL del servidor
+LLM_CONCURRENCY           = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+# Aplicar reglas numéricas antes de recurrir al LLM
+USE_NUMERIC_RULES         = True
+OCTANE_TOLERANCE          = 0.05        # margen respecto a la puntuación de referencia
+STREAM_MAX_DEVIATION      = 0.20        # caída máxima de una CPU frente a la mediana STREAM
+# Presupuesto de tokens por sección enviada al modelo (estimación: 4 caracteres por token)
+SECTION_TOKEN_BUDGET      = 3000
+CPU_MAX_BELOW_BASE        = 0.25        # fracción máxima de muestras de un núcleo bajo frecuencia_base_mhz
+GPU_LOAD_MIN_UTIL         = 90          # % de uso a partir del cual una muestra de results_N.txt cuenta como carga
+# Modo flota (--batch): máquinas procesadas a la vez
+BATCH_MACHINES            = 8
+# Entrega a Discord: límite de caracteres por mensaje y reintentos ante 429/5xx
+DISCORD_MESSAGE_LIMIT     = 2000
+DISCORD_RETRIES           = 5
+DISCORD_TIMEOUT           = 30          # segundos
+# Modo vigilancia (--watch): sondeo del log y fin de ejecución
+WATCH_POLL_INTERVAL       = 5           # segundos entre lecturas del log
+WATCH_IDLE_TIMEOUT        = 1800        # sin crecer durante este tiempo se da la ejecución por terminada
+RUN_END_MARKER            = "Todos los scripts han terminado de ejecutarse."
+# Caché en disco de análisis y veredictos (se desactiva con --no-cache)
+CACHE_DIR                 = os.environ.get("AGENT_CACHE_DIR", os.path.expanduser("~/.cache/discordagent"))
+CACHE_MAX_BYTES           = 64 * 1024 * 1024
+# Histórico de resultados (SQLite) y datos de referencia (se desactiva con --no-history)
+HISTORY_DB_PATH           = os.environ.get("AGENT_HISTORY_DB", os.path.join(CACHE_DIR, "history.sqlite3"))
+REFERENCE_DATA_FILE       = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference_scores.csv")
+HISTORY_LAST_RUNS         = 20          # máquinas iguales con las que se compara cada resultado
+HISTORY_MIN_RUNS          = 3           # mínimo de máquinas para usar la línea base
+HISTORY_TOLERANCE         = 0.05        # margen fuera de la banda p10-p90 antes de marcar KO
 # Configuración de Discord
 DISCORD_BOT_TOKEN         = "TOKEN"
 DISCORD_FORUM_CHANNEL_ID  = "TOKEN"
@@ -39,20 +84,382 @@ ADMIN_ID                  = "TOKEN"
 API_BASE_URL              = "https://discord.com/api/v9"
 # ===================================================
 
-def run_ollama_analysis(model, prompt_text):
+# === Métricas (--profile) ===
+class Profiler:
     """
-    Ejecuta un análisis con ollama y devuelve la salida.
+    Registra spans de tiempo (etapa, etiquetas y atributos) de todos los hilos.
+    Las etiquetas `serial` y `section` se heredan de los spans que los contienen,
+    así una llamada al LLM queda asociada a la máquina y sección que la originó.
     """
+    def __init__(self):
+        self.t0 = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def labels(self, **labels):
+        """Etiquetas para los spans de este hilo (p. ej. `serial` en los hilos del pool)."""
+        previous = getattr(self._local, "labels", {})
+        self._local.labels = {**previous, **labels}
+        try:
+            yield
+        finally:
+            self._local.labels = previous
+
+    @contextlib.contextmanager
+    def span(self, stage, **attrs):
+        labels = {k: attrs.pop(k) for k in ("serial", "section") if k in attrs}
+        parent = getattr(self._local, "stage", None)
+        with self.labels(**labels):
+            record = {"stage": stage, **self._local.labels, **attrs,
+                      "start": round(time.time() - self.t0, 6)}
+            if parent:
+                record["parent"] = parent
+            self._local.stage = stage
+            start = time.perf_counter()
+            try:
+                yield record
+            finally:
+                record["seconds"] = round(time.perf_counter() - start, 6)
+                self._local.stage = parent
+                with self._lock:
+                    self.spans.append(record)
+
+    def summary(self):
+        """{etapa: {count, seconds, max}}. Los spans anidados cuentan en su etapa y en la que los contiene."""
+        out = {}
+        with self._lock:
+            spans = list(self.spans)
+        for sp in spans:
+            st = out.setdefault(sp["stage"], {"count": 0, "seconds": 0.0, "max": 0.0})
+            st["count"] += 1
+            st["seconds"] += sp["seconds"]
+            st["max"] = max(st["max"], sp["seconds"])
+        return out
+
+    def to_json(self):
+        return {"started": self.t0, "elapsed": time.time() - self.t0,
+                "summary": self.summary(), "spans": sorted(self.spans, key=lambda x: x["start"])}
+
+    def to_prometheus(self):
+        def fmt_labels(**labels):
+            body = ",".join(f'{k}="{_prom_escape(v)}"' for k, v in labels.items() if v is not None)
+            return "{" + body + "}" if body else ""
+        lines = [
+            "# HELP discordagent_stage_seconds_total Tiempo acumulado por etapa.",
+            "# TYPE discordagent_stage_seconds_total counter",
+        ]
+        summary = self.summary()
+        for stage, st in sorted(summary.items()):
+            lines.append(f"discordagent_stage_seconds_total{fmt_labels(stage=stage)} {st['seconds']:.6f}")
+        lines += ["# HELP discordagent_stage_calls_total Spans registrados por etapa.",
+                  "# TYPE discordagent_stage_calls_total counter"]
+        for stage, st in sorted(summary.items()):
+            lines.append(f"discordagent_stage_calls_total{fmt_labels(stage=stage)} {st['count']}")
+        lines += ["# HELP discordagent_section_seconds_total Tiempo de análisis de cada sección.",
+                  "# TYPE discordagent_section_seconds_total counter"]
+        sections = {}
+        llm = {}
+        for sp in self.spans:
+            if sp["stage"] == "analyze_section":
+                labels = (sp.get("serial"), sp.get("section"), sp.get("source"))
+                sections[labels] = sections.get(labels, 0.0) + sp["seconds"]
+            if sp["stage"] == "llm":
+                agg = llm.setdefault((sp.get("serial"), sp.get("section")), [0, 0, 0.0, 0, 0])
+                agg[0] += sp.get("prompt_chars", 0)
+                agg[1] += sp.get("response_chars", 0)
+                agg[2] += sp.get("eval_seconds", 0.0)
+                agg[3] += sp.get("eval_count", 0)
+                agg[4] += sp.get("prompt_eval_count", 0)
+        for (serial, section, source), seconds in sorted(sections.items(), key=lambda x: tuple(map(str, x[0]))):
+            lines.append(f"discordagent_section_seconds_total"
+                         f"{fmt_labels(serial=serial, section=section, source=source)} {seconds:.6f}")
+        for name, idx, kind, help_text in (
+            ("discordagent_llm_prompt_chars_total", 0, "counter", "Caracteres enviados al LLM."),
+            ("discordagent_llm_response_chars_total", 1, "counter", "Caracteres recibidos del LLM."),
+            ("discordagent_llm_eval_tokens_total", 3, "counter", "Tokens generados según el backend."),
+            ("discordagent_llm_prompt_tokens_total", 4, "counter", "Tokens de prompt según el backend."),
+            ("discordagent_llm_tokens_per_second", None, "gauge", "Velocidad de generación del LLM."),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (serial, section), agg in sorted(llm.items(), key=lambda x: (str(x[0][0]), str(x[0][1]))):
+                if idx is None:
+                    if not agg[2]:
+                        continue
+                    value = f"{agg[3] / agg[2]:.3f}"
+                else:
+                    value = str(agg[idx])
+                lines.append(f"{name}{fmt_labels(serial=serial, section=section)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Guarda las métricas: texto de Prometheus si `path` acaba en .prom, JSON en otro caso."""
+        if path.endswith(".prom"):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+        else:
+            write_json_atomic(path, self.to_json())
+
+def _prom_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Perfilador activo (None salvo con --profile)
+_profiler = None
+
+def span(stage, **attrs):
+    """
+    Span de tiempo de una etapa. Devuelve un dict al que se pueden añadir
+    atributos (tamaños, tokens...). Sin --profile no mide nada.
+    """
+    if _profiler is None:
+        return contextlib.nullcontext({})
+    return _profiler.span(stage, **attrs)
+
+def span_labels(**labels):
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.labels(**labels)
+
+# === Cliente HTTP de Ollama ===
+_ollama_session = None
+# Hasta este instante (time.monotonic) se usa `ollama run` porque la API no respondió
+_ollama_api_down_until = 0.0
+# Limita las generaciones simultáneas de todas las secciones y máquinas
+_llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+
+def get_ollama_session():
+    """
+    Devuelve una sesión HTTP persistente (keep-alive) hacia Ollama.
+    """
+    global _ollama_session
+    if _ollama_session is None:
+        _ollama_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        _ollama_session.mount("http://", adapter)
+        _ollama_session.mount("https://", adapter)
+    return _ollama_session
+
+def ollama_generate(model, prompt_text, on_token=None, stats=None, **options):
+    """
+    Llama a /api/generate en streaming y devuelve el texto completo.
+    `on_token` recibe cada fragmento según llega y `stats` (dict opcional)
+    recibe los contadores del último fragmento (eval_count, eval_duration...).
+    Lanza requests.RequestException si la API no responde tras los reintentos.
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt_text,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+    }
+    payload.update(options)
+    session = get_ollama_session()
+    last_error = None
+    for attempt in range(OLLAMA_RETRIES + 1):
+        try:
+            with session.post(f"{OLLAMA_API_URL}/api/generate", json=payload, stream=True,
+                              timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)) as resp:
+                if resp.status_code >= 500:
+                    raise requests.HTTPError(f"{resp.status_code}: {resp.text}", response=resp)
+                resp.raise_for_status()
+                parts = []
+                for line in resp.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise requests.HTTPError(chunk["error"], response=resp)
+                    token = chunk.get("response", "")
+                    if token:
+                        parts.append(token)
+                        if on_token:
+                            on_token(token)
+                    if chunk.get("done"):
+                        if stats is not None:
+                            stats.update({k: v for k, v in chunk.items() if k.endswith(("_count", "_duration"))})
+                        break
+                return "".join(parts)
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError, ValueError) as e:
+            last_error = e
+            # Los 4xx (modelo inexistente, petición mal formada) no se reintentan
+            resp = getattr(e, "response", None)
+            if resp is not None and 400 <= resp.status_code < 500:
+                break
+            if attempt < OLLAMA_RETRIES:
+                time.sleep(2 ** attempt)
+    raise requests.RequestException(f"API de Ollama no disponible: {last_error}",
+                                    response=getattr(last_error, "response", None))
+
+def ollama_api_available():
+    """
+    False mientras dura la pausa tras un fallo de red o 5xx de la API.
+    """
+    return USE_OLLAMA_API and time.monotonic() >= _ollama_api_down_until
+
+def preload_ollama_model(model):
+    """
+    Carga el modelo en memoria antes de la primera sección (petición vacía con keep_alive).
+    Devuelve True si Ollama lo ha cargado.
+    """
+    if not ollama_api_available():
+        return False
+    try:
+        resp = get_ollama_session().post(
+            f"{OLLAMA_API_URL}/api/generate",
+            json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+        )
+        resp.raise_for_status()
+        return True
+    except requests.RequestException as e:
+        print("No se pudo precargar el modelo en Ollama:", e)
+        return False
+
+def preload_models():
+    """
+    Precarga el modelo principal y, si la cascada está activa, el de triaje.
+    Devuelve True si todos quedaron cargados.
+    """
+    ok = preload_ollama_model(MODEL_NAME)
+    if TRIAGE_MODEL:
+        ok = preload_ollama_model(TRIAGE_MODEL) and ok
+    return ok
+
+def run_ollama_cli(model, prompt_text, fmt=None):
+    """
+    Ejecuta un análisis con `ollama run` (modo de respaldo) y devuelve la salida.
+    """
+    cmd = ["ollama", "run", model, prompt_text]
+    if fmt:
+        cmd[2:2] = ["--format", fmt]
     try:
         p = subprocess.run(
-            ["ollama", "run", model, prompt_text],
+            cmd,
             capture_output=True, text=True, check=True
         )
         return p.stdout.strip()
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         print("Error al ejecutar ollama run:", e)
         return ""
 
+def run_ollama_analysis(model, prompt_text, **options):
+    """
+    Ejecuta un análisis con ollama y devuelve la salida.
+    Usa la API HTTP con sesión persistente; si no está disponible, recurre a `ollama run`.
+    `options` se añade a la petición (por ejemplo format="json").
+    """
+    global _ollama_api_down_until
+    with _llm_slots, span("llm", model=model, prompt_chars=len(prompt_text)) as m:
+        result = None
+        if ollama_api_available():
+            stats = {}
+            try:
+                result = ollama_generate(model, prompt_text, stats=stats, **options).strip()
+                m["backend"] = "api"
+                _record_llm_stats(m, stats)
+            except requests.RequestException as e:
+                resp = getattr(e, "response", None)
+                if resp is not None and 400 <= resp.status_code < 500:
+                    # Error de esta petición (p. ej. modelo no descargado): la API sigue disponible
+                    print(f"Error en la API de Ollama con {model}:", e)
+                    m["backend"] = "api"
+                    result = ""
+                else:
+                    print(f"Error en la API de Ollama, se usará `ollama run` durante {OLLAMA_API_COOLDOWN} s:", e)
+                    _ollama_api_down_until = time.monotonic() + OLLAMA_API_COOLDOWN
+        if result is None:
+            m["backend"] = "cli"
+            result = run_ollama_cli(model, prompt_text, options.get("format"))
+        m["response_chars"] = len(result)
+        return result
+
+def _record_llm_stats(m, stats):
+    # Ollama informa de las duraciones en nanosegundos
+    for key in ("eval_count", "prompt_eval_count"):
+        if key in stats:
+            m[key] = stats[key]
+    if stats.get("eval_duration"):
+        m["eval_seconds"] = stats["eval_duration"] / 1e9
+        m["tokens_per_s"] = round(stats.get("eval_count", 0) / m["eval_seconds"], 3)
+    if stats.get("prompt_eval_duration"):
+        m["prompt_eval_seconds"] = stats["prompt_eval_duration"] / 1e9
+
+# === Caché de resultados del LLM ===
+_cache_enabled = True
+
+def cache_key(*parts):
+    """
+    Clave de contenido: hash SHA-256 de las partes (modelo, plantilla, texto...).
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8", errors="replace"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def write_json_atomic(path, obj):
+    """
+    Escribe `obj` como JSON en un temporal y lo renombra: nunca queda un fichero a medias.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def cache_get(key):
+    """
+    Devuelve la entrada guardada para `key` o None. Actualiza su fecha para el LRU.
+    """
+    if not _cache_enabled:
+        return None
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)
+        return entry
+    except (OSError, ValueError):
+        return None
+
+def cache_put(key, entry):
+    """
+    Guarda `entry` (dict serializable) de forma atómica y aplica la expulsión LRU.
+    """
+    if not _cache_enabled:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_json_atomic(os.path.join(CACHE_DIR, f"{key}.json"), entry)
+        evict_cache()
+    except OSError as e:
+        print("No se pudo escribir en la caché:", e)
+
+def evict_cache(max_bytes=None):
+    """
+    Borra las entradas menos usadas hasta que la caché ocupe menos de `max_bytes`.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    with os.scandir(CACHE_DIR) as it:
+        for e in it:
+            if e.name.endswith(".json"):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+    if total <= max_bytes:
+        return
+    entries.sort()
+    for _, size, path in entries:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= max_bytes:
+            break
+
 def is_abnormal(text):
     """
     Pregunta al modelo si el análisis contiene una anomalía.
@@ -64,45 +471,21 @@ def is_abnormal(text):
         "Responde SOLO con ANOMALIA o OK.\n\n"
         f"{text}"
     )
-    resp = run_ollama_analysis(MODEL_NAME, prompt).upper()
-    return resp.startswith("ANOMALIA")
-
-def generate_pdf_report(serial, analyses):
-    """
-    Genera un PDF con:
-     - Portada con nombre de máquina y fecha
-     - Índice automático con hipervínculos
-     - Secciones coloreadas: verde si OK, rojo si anomalía
-    """
-    pdf_filename = f"{serial}_informe.pdf"
-
-    class MyDocTemplate(BaseDocTemplate):
-        def __init__(self, filename, **kw):
-            super().__init__(filename, pagesize=A4, **kw)
-            frame = Frame(self.leftMargin, self.bottomMargin,
-                          self.width, self.height, id='normal')
-            tpl = PageTemplate(id='normal', frames=[frame],
-                               onPage=self._header_footer)
-            self.addPageTemplates([tpl])
-
-        def afterFlowable(self, flowable):
-            if isinstance(flowable, Paragraph) and flowable.style.name in ('HeadingOK','HeadingError'):
-                text = flowable.getPlainText()
-                self.notify('TOCEntry', (0, text, self.page))
-                key = text.replace(' ', '_')
-                self.canv.bookmarkPage(key)
-                self.canv.addOutlineEntry(text, key, level=0, closed=False)
-
-        def _header_footer(self, canvas, doc):
-            page_num = canvas.getPageNumber()
-            canvas.setFont('Helvetica', 9)
-            canvas.drawRightString(
-                A4[0] - doc.rightMargin,
-                doc.bottomMargin - 0.5*cm,
-                f"Página {page_num} | {serial}"
-            )
+    key = cache_key("is_abnormal", MODEL_NAME, text)
+    with span("is_abnormal") as m:
+        cached = cache_get(key)
+        if cached is not None:
+            m["source"] = "cache"
+            return cached["abnormal"]
+        m["source"] = "llm"
+        resp = run_ollama_analysis(MODEL_NAME, prompt).upper()
+        abnormal = resp.startswith("ANOMALIA")
+        if resp:
+            cache_put(key, {"abnormal": abnormal})
+        return abnormal
 
-    doc = MyDocTemplate(pdf_filename)
+# === Informe PDF ===
+def _build_pdf_styles():
     styles = getSampleStyleSheet()
 
     # Portada centrada
@@ -134,118 +517,493 @@ def generate_pdf_report(serial, analyses):
     normal.leading = 14
     normal.spaceAfter = 4
 
+    styles.add(ParagraphStyle(
+        name='TOCLevel1', parent=normal,
+        fontSize=12, leading=15, spaceBefore=5
+    ))
+    styles.add(ParagraphStyle(
+        name='FleetCell', parent=normal,
+        fontSize=9, leading=11, spaceAfter=0
+    ))
+    return styles
+
+# Estilos construidos una sola vez por proceso
+PDF_STYLES = _build_pdf_styles()
+
+def _section_key(bench):
+    return "sec_" + re.sub(r"\W", "_", bench)
+
+class TOCLine(Flowable):
+    """
+    Entrada del índice: nombre de la sección enlazado a su marcador y número de
+    página. El número es un form XObject que se define al maquetar la sección
+    (referencia adelantada), así el índice no necesita una segunda pasada.
+    """
+    def __init__(self, text, key, style=None):
+        super().__init__()
+        self.text = text
+        self.key = key
+        self.style = style or PDF_STYLES['TOCLevel1']
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        return availWidth, self.style.leading
+
+    def getSpaceBefore(self):
+        return self.style.spaceBefore
+
+    def draw(self):
+        canv = self.canv
+        st = self.style
+        canv.setFont(st.fontName, st.fontSize)
+        canv.drawString(0, 0, self.text)
+        start = canv.stringWidth(self.text, st.fontName, st.fontSize) + 6
+        dots = "." * int(max(0, self.width - start - 40) / canv.stringWidth(".", st.fontName, st.fontSize))
+        canv.drawString(start, 0, dots)
+        canv.saveState()
+        canv.translate(self.width, 0)
+        canv.doForm(f"toc_{self.key}")
+        canv.restoreState()
+        canv.linkRect("", self.key, (0, -2, self.width, st.leading - 2), relative=1, thickness=0)
+
+class SectionHeading(Paragraph):
+    """Título de sección que registra marcador, outline y número de página."""
+    def __init__(self, text, style, key):
+        super().__init__(escape(text), style)
+        self.key = key
+
+class ReportDocTemplate(BaseDocTemplate):
+    def __init__(self, filename, serial, **kw):
+        super().__init__(filename, pagesize=A4, **kw)
+        self.serial = serial
+        frame = Frame(self.leftMargin, self.bottomMargin,
+                      self.width, self.height, id='normal')
+        tpl = PageTemplate(id='normal', frames=[frame],
+                           onPage=self._header_footer)
+        self.addPageTemplates([tpl])
+
+    def afterFlowable(self, flowable):
+        if isinstance(flowable, SectionHeading):
+            canv = self.canv
+            canv.bookmarkPage(flowable.key)
+            canv.addOutlineEntry(flowable.getPlainText(), flowable.key, level=0, closed=False)
+            # Define el número de página que dibuja la entrada del índice
+            st = PDF_STYLES['TOCLevel1']
+            canv.beginForm(f"toc_{flowable.key}", lowerx=-60, lowery=-5, upperx=0, uppery=st.leading)
+            canv.setFont(st.fontName, st.fontSize)
+            canv.drawRightString(0, 0, str(self.page))
+            canv.endForm()
+
+    def _header_footer(self, canvas, doc):
+        page_num = canvas.getPageNumber()
+        canvas.setFont('Helvetica', 9)
+        canvas.drawRightString(
+            A4[0] - doc.rightMargin,
+            doc.bottomMargin - 0.5*cm,
+            f"Página {page_num} | {self.serial}"
+        )
+
+def analysis_flowables(analysis, style=None):
+    """
+    Convierte un análisis en párrafos escapados: las líneas consecutivas se
+    agrupan en un único Paragraph (unidas con <br/>) y las líneas en blanco
+    separan bloques.
+    """
+    style = style or PDF_STYLES['Normal']
+    blocks, current = [], []
+    for line in analysis.splitlines():
+        if line.strip():
+            current.append(escape(line))
+        elif current:
+            blocks.append(current)
+            current = []
+    if current:
+        blocks.append(current)
+    return [Paragraph("<br/>".join(b), style) for b in blocks]
+
+FLEET_TABLE_HEADER = ["Métrica", "Esta máquina", "Mediana", "p10 - p90", "N", "Estado"]
+# Proporción de cada columna sobre el ancho del marco
+FLEET_TABLE_COLUMNS = [0.35, 0.14, 0.13, 0.18, 0.06, 0.14]
+
+def fleet_table(rows, width):
+    """
+    Tabla "esta máquina frente a las últimas N iguales" ajustada a `width`
+    (el ancho del marco); las filas fuera de banda en rojo.
+    """
+    data = [FLEET_TABLE_HEADER] + [[Paragraph(escape(r[0]), PDF_STYLES['FleetCell'])] + r[1:] for r in rows]
+    table = Table(data, colWidths=[width * f for f in FLEET_TABLE_COLUMNS], repeatRows=1)
+    style = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E4053')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('ALIGN', (1, 1), (-2, -1), 'RIGHT'),
+    ]
+    for i, r in enumerate(rows, start=1):
+        if r[-1] != "OK":
+            style.append(('TEXTCOLOR', (-1, i), (-1, i), colors.red))
+    table.setStyle(TableStyle(style))
+    return table
+
+def generate_pdf_report(serial, analyses, verdicts=None, output_dir="", fleet=None):
+    """
+    Genera un PDF con:
+     - Portada con nombre de máquina y fecha
+     - Índice automático con hipervínculos
+     - Comparativa con las últimas máquinas iguales (`fleet`, filas de fleet_comparison_rows)
+     - Secciones coloreadas: verde si OK, rojo si anomalía
+    `verdicts` (bench -> bool) evita volver a preguntar al modelo por cada sección.
+    El índice se conoce de antemano, así que basta una sola pasada de maquetación.
+    """
+    verdicts = verdicts or {}
+    pdf_filename = os.path.join(output_dir, f"{serial}_informe.pdf")
+    styles = PDF_STYLES
+    normal = styles['Normal']
+    doc = ReportDocTemplate(pdf_filename, serial)
+
     story = []
     # --- Portada ---
     story.append(Spacer(1, 2*cm))
-    story.append(Paragraph(f"Informe de Benchmark: {serial}", styles['TitleCenter']))
+    story.append(Paragraph(escape(f"Informe de Benchmark: {serial}"), styles['TitleCenter']))
     story.append(Spacer(1, 0.5*cm))
-    story.append(Paragraph(f"Máquina: {serial}", normal))
+    story.append(Paragraph(escape(f"Máquina: {serial}"), normal))
     story.append(Paragraph(f"Fecha de generación: {time.strftime('%Y-%m-%d %H:%M:%S')}", normal))
     story.append(PageBreak())
 
     # --- Índice ---
     story.append(Paragraph("Índice de contenido", styles['Heading1']))
-    toc = TableOfContents()
-    toc.levelStyles = [
-        ParagraphStyle(fontSize=12, name='TOCLevel1',
-                       leftIndent=20, firstLineIndent=-20, spaceBefore=5),
-    ]
-    story.append(toc)
+    if fleet:
+        story.append(TOCLine("Comparativa con la flota", _section_key("Comparativa con la flota")))
+    for bench in analyses:
+        story.append(TOCLine(bench, _section_key(bench)))
     story.append(PageBreak())
 
+    # --- Comparativa con la flota ---
+    if fleet:
+        story.append(SectionHeading("Comparativa con la flota", styles['Heading1'],
+                                    _section_key("Comparativa con la flota")))
+        story.append(Paragraph("Esta máquina frente a las últimas máquinas con el mismo modelo de GPU o CPU.", normal))
+        story.append(Spacer(1, 0.2*cm))
+        story.append(fleet_table(fleet, doc.width))
+        story.append(Spacer(1, 0.5*cm))
+
     # --- Secciones ---
     for bench, analysis in analyses.items():
-        style_name = 'HeadingError' if is_abnormal(analysis) else 'HeadingOK'
-        story.append(Paragraph(bench, styles[style_name]))
+        abnormal = verdicts[bench] if bench in verdicts else is_abnormal(analysis)
+        style_name = 'HeadingError' if abnormal else 'HeadingOK'
+        story.append(SectionHeading(bench, styles[style_name], _section_key(bench)))
         story.append(Spacer(1, 0.2*cm))
-        for line in analysis.splitlines():
-            story.append(Paragraph(line, normal))
+        story.extend(analysis_flowables(analysis, normal))
         story.append(Spacer(1, 0.5*cm))
 
-    doc.multiBuild(story)
+    doc.build(story)
     return pdf_filename
 
+# === Entrega a Discord ===
+_discord_session = None
+_discord_lock = threading.Lock()
+# Estado de los buckets de Discord: ruta -> (peticiones restantes, instante de reinicio)
+_discord_buckets = {}
+_discord_global_reset = 0.0
+
+def get_discord_session():
+    """
+    Sesión HTTP compartida (pool keep-alive) con la cabecera de autorización del bot.
+    """
+    global _discord_session
+    with _discord_lock:
+        if _discord_session is None:
+            _discord_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=16)
+            _discord_session.mount("https://", adapter)
+            _discord_session.mount("http://", adapter)
+            _discord_session.headers["Authorization"] = f"Bot {DISCORD_BOT_TOKEN}"
+    return _discord_session
+
+def _wait_discord_bucket(route):
+    # Reserva una petición del bucket; si está agotado espera a su reinicio
+    with _discord_lock:
+        now = time.monotonic()
+        remaining, reset_at = _discord_buckets.get(route, (1, 0.0))
+        if reset_at <= now:
+            remaining, reset_at = max(remaining, 1), 0.0
+        delay = max(_discord_global_reset - now, 0.0)
+        if remaining <= 0:
+            delay = max(delay, reset_at - now)
+            remaining, reset_at = 1, 0.0
+        _discord_buckets[route] = (remaining - 1, reset_at)
+    if delay > 0:
+        time.sleep(delay)
+
+def _update_discord_bucket(route, resp):
+    global _discord_global_reset
+    h = resp.headers
+    with _discord_lock:
+        now = time.monotonic()
+        if "X-RateLimit-Remaining" in h and "X-RateLimit-Reset-After" in h:
+            _discord_buckets[route] = (int(h["X-RateLimit-Remaining"]), now + float(h["X-RateLimit-Reset-After"]))
+        if resp.status_code == 429:
+            try:
+                body = resp.json()
+            except ValueError:
+                body = {}
+            retry_after = float(body.get("retry_after", h.get("Retry-After", 1)))
+            if body.get("global") or h.get("X-RateLimit-Global"):
+                _discord_global_reset = now + retry_after
+            else:
+                _discord_buckets[route] = (0, now + retry_after)
+
+def discord_request(method, path, idempotent=False, **kwargs):
+    """
+    Petición a la API de Discord respetando X-RateLimit-* y los 429 (retry_after).
+    Los 5xx y errores de red solo se reintentan si la petición es idempotente
+    (p. ej. mensajes con nonce), para no duplicar publicaciones.
+    Devuelve la respuesta final o None si no se pudo enviar.
+    """
+    session = get_discord_session()
+    route = f"{method} {path}"
+    with span("discord", endpoint=f"{method} {path.rsplit('/', 1)[-1]}") as m:
+        for attempt in range(DISCORD_RETRIES + 1):
+            m["attempts"] = attempt + 1
+            _wait_discord_bucket(route)
+            try:
+                resp = session.request(method, f"{API_BASE_URL}{path}", timeout=DISCORD_TIMEOUT, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (idempotent or isinstance(e, requests.ConnectTimeout)) or attempt == DISCORD_RETRIES:
+                    print("Error de conexión con Discord:", e)
+                    return None
+                time.sleep(2 ** attempt)
+                continue
+            _update_discord_bucket(route, resp)
+            m["status"] = resp.status_code
+            if resp.status_code == 429:
+                m["rate_limited"] = m.get("rate_limited", 0) + 1
+                continue
+            if resp.status_code >= 500 and idempotent and attempt < DISCORD_RETRIES:
+                time.sleep(2 ** attempt)
+                continue
+            return resp
+        return None
+
+def _message_nonce(channel_id, content, extra=""):
+    # Discord descarta el mensaje repetido si llega con el mismo nonce (enforce_nonce)
+    return cache_key("discord", str(channel_id), content, extra)[:25]
+
+def _wrap_line(line, width):
+    while len(line) > width:
+        cut = line.rfind(" ", 0, width)
+        cut = width if cut <= 0 else cut
+        yield line[:cut]
+        line = line[cut:].lstrip(" ")
+    yield line
+
+def split_message(content, limit=DISCORD_MESSAGE_LIMIT):
+    """
+    Divide `content` en trozos de hasta `limit` caracteres cortando por líneas
+    (o por espacios si una línea no cabe). Los bloques de código ``` que quedan
+    partidos se cierran y se reabren en el trozo siguiente.
+    """
+    chunks = []
+    current, size = [], 0
+    fence = None  # línea que abrió el bloque de código en curso
+    for line in content.split("\n"):
+        for piece in _wrap_line(line, limit - 32):
+            is_fence = piece.strip().startswith("```")
+            # El cierre "\n```" se cuenta con el estado del bloque tras añadir esta línea
+            opens = (fence is None) if is_fence else (fence is not None)
+            if current and size + len(piece) + 1 + (4 if opens else 0) > limit:
+                chunks.append("\n".join(current + (["```"] if fence else [])))
+                current = [fence] if fence else []
+                size = len(fence) if fence else 0
+            size += len(piece) + (1 if current else 0)
+            current.append(piece)
+            if is_fence:
+                fence = None if fence else piece.strip()
+    if current:
+        chunks.append("\n".join(current + (["```"] if fence else [])))
+    # Sin trozos vacíos ni formados solo por marcas de bloque (```...```)
+    return [c for c in chunks if any(l.strip() and not l.strip().startswith("```") for l in c.split("\n"))]
+
 def send_file_to_channel(channel_id, file_path, content=None):
-    url = f"{API_BASE_URL}/channels/{channel_id}/messages"
-    headers = {"Authorization": f"Bot {DISCORD_BOT_TOKEN}"}
-    data = {}
-    if content:
-        data["content"] = content
     with open(file_path, 'rb') as f:
-        files = {"file": (os.path.basename(file_path), f, "application/pdf")}
-        resp = requests.post(url, headers=headers, data=data, files=files)
-    if resp.status_code in (200,201):
+        data = f.read()
+    payload = {"nonce": _message_nonce(channel_id, content or "", hashlib.sha256(data).hexdigest()),
+               "enforce_nonce": True}
+    if content:
+        payload["content"] = content
+    resp = discord_request(
+        "POST", f"/channels/{channel_id}/messages", idempotent=True,
+        data={"payload_json": json.dumps(payload)},
+        files={"file": (os.path.basename(file_path), data, "application/pdf")},
+    )
+    if resp is not None and resp.status_code in (200,201):
         return resp.json().get("id")
-    print("Error al enviar archivo a Discord:", resp.text)
+    print("Error al enviar archivo a Discord:", resp.text if resp is not None else "sin respuesta")
     return None
 
 def create_discord_thread(channel_id, thread_name, auto_archive_duration=1440):
-    url = f"{API_BASE_URL}/channels/{channel_id}/threads"
-    headers = {
-        "Authorization": f"Bot {DISCORD_BOT_TOKEN}",
-        "Content-Type": "application/json"
-    }
     payload = {
         "name": thread_name,
         "auto_archive_duration": auto_archive_duration,
         "type": 11,
         "message": {"content": "Hilo de análisis generado automáticamente."}
     }
-    resp = requests.post(url, headers=headers, json=payload)
-    if resp.status_code in (200,201):
+    resp = discord_request("POST", f"/channels/{channel_id}/threads", json=payload)
+    if resp is not None and resp.status_code in (200,201):
         return resp.json()["id"]
-    print("Error al crear hilo:", resp.text)
+    print("Error al crear hilo:", resp.text if resp is not None else "sin respuesta")
     return None
 
-def send_message_to_channel(channel_id, content):
-    url = f"{API_BASE_URL}/channels/{channel_id}/messages"
-    headers = {
-        "Authorization": f"Bot {DISCORD_BOT_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    resp = requests.post(url, headers=headers, json={"content": content})
-    if resp.status_code in (200,201):
+def send_message_to_channel(channel_id, content, nonce=None):
+    payload = {"content": content, "nonce": nonce or _message_nonce(channel_id, content), "enforce_nonce": True}
+    resp = discord_request("POST", f"/channels/{channel_id}/messages", idempotent=True, json=payload)
+    if resp is not None and resp.status_code in (200,201):
         return resp.json()["id"]
-    print("Error al enviar mensaje:", resp.text)
+    print("Error al enviar mensaje:", resp.text if resp is not None else "sin respuesta")
     return None
 
-def send_long_message(channel_id, content, max_length=1900):
-    ids = []
-    for i in range(0, len(content), max_length):
-        chunk = content[i:i+max_length]
-        mid = send_message_to_channel(channel_id, chunk)
-        if mid:
-            ids.append(mid)
-        time.sleep(1)
-    return ids
+def send_long_message(channel_id, content, max_length=DISCORD_MESSAGE_LIMIT, posted=None, on_post=None):
+    """
+    Publica `content` en varios mensajes. `posted` (índice del trozo -> id) guarda
+    los trozos ya publicados: se saltan y se van completando, y `on_post` se llama
+    tras cada uno. Devuelve la lista de ids o None si algún trozo no se publicó.
+    """
+    posted = {} if posted is None else posted
+    for i, chunk in enumerate(split_message(content, max_length)):
+        if str(i) in posted:
+            continue
+        mid = send_message_to_channel(channel_id, chunk, nonce=_message_nonce(channel_id, content, str(i)))
+        if not mid:
+            return None
+        posted[str(i)] = mid
+        if on_post:
+            on_post()
+    return list(posted.values())
+
+# === Separación del log en secciones ===
+# Texto que marca el inicio de cada sección. Si una línea contiene varios,
+# gana el primero en este orden.
+SECTION_MARKERS = {
+    "Configuracion":   "se van a ejecutar los siguientes scripts en secuencia",
+    "Valores":         "Estadísticas del sistema",
+    "Gobernador":      "Ejecutando Gobernador",
+    "Octane":          "Ejecutando Octane",
+    "GeekbenchGPU":    "Prueba en la GPU",
+    "Anchobanda":      "Ejecutando STREAM Benchmark",
+    "Mprime":          "Ejecutando Mprime",
+    "Geekbench":       "Ejecutando Geekbench",
+    "GPU-BURN":        "Ejecutando GPU-BURN",
+    "FIO":             "Ejecutando FIO",
+    "Sectores":        "Ejecutando Sectores",
+    "Resultado":       "Ejecutando Resultado",
+    "Comprobaciones":  "Ejecutando Comprobaciones"
+}
+SECTION_MARKERS_IGNORECASE = {"Configuracion"}
+
+def _marker_pattern(bench):
+    pat = re.escape(SECTION_MARKERS[bench])
+    return f"(?i:{pat})" if bench in SECTION_MARKERS_IGNORECASE else pat
+
+def _compile_marker_scanners(as_bytes):
+    """
+    Agrupa los marcadores por su primera palabra ("Ejecutando ...") en pocas
+    expresiones con prefijo literal, que sre busca sin recorrer la alternancia
+    carácter a carácter.
+    """
+    groups = {}
+    for bench, text in SECTION_MARKERS.items():
+        if bench in SECTION_MARKERS_IGNORECASE:
+            # IGNORECASE desactiva la búsqueda rápida de literales; [sS] no
+            pat = "".join(f"[{c.lower()}{c.upper()}]" if c.isascii() and c.isalpha() else re.escape(c)
+                          for c in text)
+            groups[pat] = None
+            continue
+        head, sep, tail = text.partition(" ")
+        groups.setdefault(re.escape(head + sep), []).append(re.escape(tail))
+    patterns = [head if tails is None else f"{head}(?:{'|'.join(tails)})" for head, tails in groups.items()]
+    if as_bytes:
+        return [re.compile(p.encode("utf-8")) for p in patterns]
+    return [re.compile(p) for p in patterns]
+
+_MARKERS_STR = [(b, re.compile(_marker_pattern(b))) for b in SECTION_MARKERS]
+_MARKERS_BYTES = [(b, re.compile(_marker_pattern(b).encode("utf-8"))) for b in SECTION_MARKERS]
+_SCANNERS_STR = _compile_marker_scanners(as_bytes=False)
+_SCANNERS_BYTES = _compile_marker_scanners(as_bytes=True)
+
+# Separadores de línea de str.splitlines() distintos de "\n" (en UTF-8 para el mmap)
+_LINE_SEPS_STR = re.compile("\r\n|[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+_LINE_SEPS_BYTES = re.compile(rb"\r\n|[\r\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+
+def find_section_spans(buf):
+    """
+    Localiza los marcadores en `buf` (str, bytes o mmap) sin partirlo en líneas y
+    devuelve {sección: [(inicio, fin), ...]} con los rangos de líneas de cada
+    sección. Las líneas se cortan como str.splitlines() (también en \\x0c,
+    U+2028...), igual que parse_log_sections. El texto anterior al primer
+    marcador se descarta.
+    """
+    if isinstance(buf, str):
+        scanners, markers, nl, seps = _SCANNERS_STR, _MARKERS_STR, "\n", _LINE_SEPS_STR
+    else:
+        scanners, markers, nl, seps = _SCANNERS_BYTES, _MARKERS_BYTES, b"\n", _LINE_SEPS_BYTES
+    hits = heapq.merge(*((m.start() for m in sc.finditer(buf)) for sc in scanners))
+    spans = {b: [] for b in SECTION_MARKERS}
+    current, start, line_end = None, 0, 0
+    for pos in hits:
+        if pos < line_end:
+            continue  # otro marcador en una línea ya clasificada
+        line_start = buf.rfind(nl, 0, pos) + 1
+        line_end = buf.find(nl, pos)
+        line_end = len(buf) if line_end == -1 else line_end + 1
+        # Dentro de la línea física, el marcador puede ir tras otro separador
+        ends = [m.end() for m in seps.finditer(buf[line_start:pos])]
+        if ends:
+            line_start += ends[-1]
+        m = seps.search(buf, pos, line_end)
+        if m:
+            line_end = m.end()
+        line = buf[line_start:line_end]
+        bench = next(b for b, pat in markers if pat.search(line))
+        if current is not None:
+            spans[current].append((start, line_start))
+        current, start = bench, line_start
+    if current is not None:
+        spans[current].append((start, len(buf)))
+    return spans
 
 def parse_log_sections(log_content):
-    benchmarks = {
-        "Configuracion":   r"(?i)se van a ejecutar los siguientes scripts en secuencia",
-        "Valores":         r"Estadísticas del sistema",
-        "Gobernador":      r"Ejecutando Gobernador",
-        "Octane":          r"Ejecutando Octane",
-        "GeekbenchGPU":    r"Prueba en la GPU",
-        "Anchobanda":      r"Ejecutando STREAM Benchmark",
-        "Mprime":          r"Ejecutando Mprime",
-        "Geekbench":       r"Ejecutando Geekbench",
-        "GPU-BURN":        r"Ejecutando GPU-BURN",
-        "FIO":             r"Ejecutando FIO",
-        "Sectores":        r"Ejecutando Sectores",
-        "Resultado":       r"Ejecutando Resultado",
-        "Comprobaciones":  r"Ejecutando Comprobaciones"
-    }
-    sections = {k: "" for k in benchmarks}
-    current = None
-    for line in log_content.splitlines():
-        for b, pat in benchmarks.items():
-            if re.search(pat, line):
-                current = b
-                sections[b] += line + "\n"
-                break
-        else:
-            if current:
-                sections[current] += line + "\n"
+    normalized = "\n".join(log_content.splitlines()) + "\n"
+    spans = find_section_spans(normalized)
+    return {b: "".join(normalized[s:e] for s, e in spans[b]) for b in SECTION_MARKERS}
+
+def load_log_sections(path):
+    """
+    Igual que parse_log_sections pero leyendo el fichero mediante mmap: solo se
+    decodifican los rangos de cada sección, sin cargar ni copiar el log completo.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {b: "" for b in SECTION_MARKERS}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return sections_from_spans(mm, find_section_spans(mm))
+
+def sections_from_spans(buf, spans):
+    """
+    Decodifica los rangos de bytes {sección: [(inicio, fin)]} de `buf` con los
+    finales de línea normalizados a "\n".
+    """
+    sections = {b: "" for b in SECTION_MARKERS}
+    for bench, ranges in spans.items():
+        parts = []
+        for s, e in ranges:
+            chunk = buf[s:e].decode("utf-8", errors="replace")
+            if _LINE_SEPS_STR.search(chunk):
+                chunk = "".join(l + "\n" for l in chunk.splitlines())
+            elif not chunk.endswith("\n"):
+                chunk += "\n"
+            parts.append(chunk)
+        sections[bench] = "".join(parts)
     return sections
 
 def get_prompt_template(benchmark):
@@ -286,30 +1044,7 @@ def get_prompt_template(benchmark):
         "Lee la sección de logs del test 'Octane' y busca el archivo 'result.csv'.\n\n"
         "1. Extrae la puntuación exacta registrada (línea que contenga 'La puntuación de la tarjeta gráfica es:').\n"
         "2. Compara ese valor con las puntuaciones de referencia:\n"
-        "   • RTX PRO 6000 Blackwell Workstation Edition: 1771.0\n"
-        "   • RTX 5090: 1743.0\n"
-        "   • RTX 5090 D: 1495.0\n"
-        "   • RTX 4090: 1304.5\n"
-        "   • RTX 6000 Ada Generation: 1196.0\n"
-        "   • NVIDIA RTX5880-Ada-48Q: 1194.0\n"
-        "   • RTX 4090 D: 1191.0\n"
-        "   • RTX 5080: 971.5\n"
-        "   • RTX 4080 Super: 948.0\n"
-        "   • L40S: 911.0\n"
-        "   • RTX 4080: 884.0\n"
-        "   • RTX 4070 Ti Super: 869.0\n"
-        "   • RTX 5070 Ti: 858.0\n"
-        "   • RTX 5090 Laptop GPU: 827.0\n"
-        "   • RTX 4090 Laptop GPU: 805.0\n"
-        "   • RTX 4070 Ti: 761.5\n"
-        "   • RTX 4070 Super: 702.0\n"
-        "   • RTX 5070: 696.0\n"
-        "   • RTX 5000 Ada Generation: 662.5\n"
-        "   • RTX 3090: 651.0\n"
-        "   • RTX A6000: 651.5\n"
-        "   • RTX 4070: 613.5\n"
-        "   • RTX 3090 Ti: 597.0\n"
-        "   • RTX A5000: 577.0\n"
+        + "".join(f"   • {name}: {score}\n" for name, score in reference_scores("octane")) +
         "3. Si tu puntuación coincide o está dentro de un 5 % de la de referencia para tu GPU, indica “resultado correcto”; "
         "   de lo contrario, indica “resultado no correcto” y sugiere verificar configuración o hardware.\n"
         "4. Incluye siempre al final este enlace para consultar más comparativas:\n"
@@ -377,32 +1112,8 @@ def get_prompt_template(benchmark):
     return templates.get(benchmark, "Analiza los resultados de este test.")
 
 def get_octane_prompt(gpu_list):
-    referencia = (
-        "Las puntuaciones aproximadas por GPU son:\n"
-        "RTX PRO 6000 Blackwell Workstation Edition: 1771.0\n"
-        "RTX 5090: 1743.0\n"
-        "RTX 5090 D: 1495.0\n"
-        "RTX 4090: 1304.5\n"
-        "RTX 6000 Ada Generation: 1196.0\n"
-        "NVIDIA RTX5880-Ada-48Q: 1194.0\n"
-        "RTX 4090 D: 1191.0\n"
-        "RTX 5080: 971.5\n"
-        "RTX 4080 Super: 948.0\n"
-        "L40S: 911.0\n"
-        "RTX 4080: 884.0\n"
-        "RTX 4070 Ti Super: 869.0\n"
-        "RTX 5070 Ti: 858.0\n"
-        "RTX 5090 Laptop GPU: 827.0\n"
-        "RTX 4090 Laptop GPU: 805.0\n"
-        "RTX 4070 Ti: 761.5\n"
-        "RTX 4070 Super: 702.0\n"
-        "RTX 5070: 696.0\n"
-        "RTX 5000 Ada Generation: 662.5\n"
-        "RTX 3090: 651.0\n"
-        "RTX A6000: 651.5\n"
-        "RTX 4070: 613.5\n"
-        "RTX 3090 Ti: 597.0\n"
-        "RTX A5000: 577.0\n"
+    referencia = "Las puntuaciones aproximadas por GPU son:\n" + "".join(
+        f"{name}: {score}\n" for name, score in reference_scores("octane")
     )
     gpus_str = ", ".join(gpu_list) if gpu_list else "desconocida(s)"
     return (
@@ -413,49 +1124,1688 @@ def get_octane_prompt(gpu_list):
         "Finalmente, indica si el rendimiento te parece aceptable según esa puntuación."
     )
 
-def main():
-    if not os.path.exists(LOG_FILE_PATH):
-        print(f"No existe '{LOG_FILE_PATH}'."); sys.exit(1)
-    with open(LOG_FILE_PATH, "r", encoding="utf-8", errors="replace") as f:
-        content = f.read()
+# === Telemetría de GPU (results_N.txt) ===
+# Línea de nvidia-smi: fecha, nombre, bus PCI, uso %, temperatura, reloj MHz, potencia W
+_GPU_SAMPLE_RE = re.compile(
+    rb"^(\d{4}/\d\d/\d\d \d\d:\d\d:\d\d(?:\.\d+)?), ([^,]+), ([^,]+), "
+    rb"(\d+(?:\.\d+)?) %, (\d+(?:\.\d+)?), (\d+(?:\.\d+)?) MHz, (\d+(?:\.\d+)?) W",
+    re.M
+)
 
-    basename = os.path.basename(LOG_FILE_PATH)
-    serial = basename[:-len("_final.txt")] if basename.endswith("_final.txt") else os.path.splitext(basename)[0]
+def load_gpu_samples(path):
+    """
+    Lee un results_N.txt en columnas NumPy: t (s desde la primera muestra),
+    util, temp, clock y power. Devuelve None si no hay muestras válidas.
+    """
+    with open(path, "rb") as f:
+        rows = _GPU_SAMPLE_RE.findall(f.read())
+    if not rows:
+        return None
+    cols = list(zip(*rows))
+    stamps = np.char.replace(np.char.replace(np.array(cols[0]).astype(str), "/", "-"), " ", "T")
+    t = stamps.astype("datetime64[ms]").astype(np.int64) / 1000.0
+    return {
+        "name": cols[1][0].decode("utf-8", errors="replace").strip(),
+        "bus": cols[2][0].decode("utf-8", errors="replace").strip(),
+        "t": t - t[0],
+        "util": np.array(cols[3], dtype=np.float64),
+        "temp": np.array(cols[4], dtype=np.float64),
+        "clock": np.array(cols[5], dtype=np.float64),
+        "power": np.array(cols[6], dtype=np.float64),
+    }
 
-    thread_id = create_discord_thread(DISCORD_FORUM_CHANNEL_ID, f"Análisis {serial}")
-    if not thread_id:
-        sys.exit(1)
+def summarize_gpu_samples(samples, base_clock=None):
+    """
+    Estadísticas de las muestras bajo carga (uso >= GPU_LOAD_MIN_UTIL): reloj
+    mínimo/p5/mediana, segundos por debajo del clock base, temperatura máxima,
+    pendiente térmica (ºC/min) y estabilidad de potencia (desviación / media).
+    """
+    t = samples["t"]
+    dt = np.diff(t, append=t[-1] + (np.median(np.diff(t)) if len(t) > 1 else 0.0))
+    load = samples["util"] >= GPU_LOAD_MIN_UTIL
+    if not load.any():
+        return None
+    clock = samples["clock"][load]
+    temp = samples["temp"][load]
+    power = samples["power"][load]
+    below = float(dt[load][clock < base_clock].sum()) if base_clock else 0.0
+    slope = float(np.polyfit(t[load] / 60.0, temp, 1)[0]) if load.sum() > 1 else 0.0
+    return {
+        "name": samples["name"],
+        "bus": samples["bus"],
+        "samples": int(load.sum()),
+        "load_seconds": float(dt[load].sum()),
+        "clock_min": float(clock.min()),
+        "clock_p5": float(np.percentile(clock, 5)),
+        "clock_median": float(np.median(clock)),
+        "seconds_below_base": below,
+        "temp_max": float(temp.max()),
+        "temp_slope": slope,
+        "power_mean": float(power.mean()),
+        "power_cv": float(power.std() / power.mean()) if power.mean() else 0.0,
+    }
+
+def load_gpu_telemetry(reports_dir, base_clock=None):
+    """
+    Resume todos los results_N.txt de la carpeta de reports. Devuelve {N: estadísticas}.
+    """
+    telemetry = {}
+    for path in glob.glob(os.path.join(reports_dir, "results_*.txt")):
+        m = re.search(r"results_(\d+)\.txt$", path)
+        if not m:
+            continue
+        samples = load_gpu_samples(path)
+        stats = summarize_gpu_samples(samples, base_clock) if samples else None
+        if stats:
+            telemetry[int(m.group(1))] = stats
+    return dict(sorted(telemetry.items()))
+
+def format_gpu_telemetry(telemetry):
+    lines = []
+    for gpu, st in telemetry.items():
+        lines.append(
+            f"GPU {gpu} ({st['bus']}) telemetría: reloj mín {st['clock_min']:.0f} / p5 {st['clock_p5']:.0f} / "
+            f"mediana {st['clock_median']:.0f} MHz, {st['seconds_below_base']:.0f} s de {st['load_seconds']:.0f} s "
+            f"bajo la base, Tmáx {st['temp_max']:.0f} ºC ({st['temp_slope']:+.2f} ºC/min), "
+            f"potencia {st['power_mean']:.0f} W (variación {st['power_cv'] * 100:.1f} %)"
+        )
+    return lines
+
+# === Frecuencias por núcleo (cpu_clocks.txt) ===
+_CPU_MHZ_RE = re.compile(rb"^cpu MHz\s*:\s*(\d+(?:\.\d+)?)", re.M)
+
+def analyze_cpu_clocks(path, num_cores, base_mhz=None):
+    """
+    Convierte cpu_clocks.txt (un bloque de `num_cores` líneas "cpu MHz" por
+    captura) en una matriz (captura x núcleo) y resume cada núcleo: mínimo,
+    percentiles y fracción de muestras por debajo de `base_mhz`.
+    """
+    with open(path, "rb") as f:
+        mhz = np.array(_CPU_MHZ_RE.findall(f.read()), dtype=np.float64)
+    if not num_cores or len(mhz) < num_cores:
+        return None
+    samples = mhz[:len(mhz) - len(mhz) % num_cores].reshape(-1, num_cores)
+    p5, p50, p95 = np.percentile(samples, [5, 50, 95], axis=0)
+    below = (samples < base_mhz).mean(axis=0) if base_mhz else np.zeros(num_cores)
+    return {
+        "cores": num_cores,
+        "captures": samples.shape[0],
+        "base_mhz": base_mhz,
+        "min": samples.min(axis=0),
+        "p5": p5,
+        "p50": p50,
+        "p95": p95,
+        "below_fraction": below,
+    }
+
+def format_cpu_clocks(result, max_cores=16):
+    """
+    Tabla compacta: percentiles globales, histograma de mínimos por núcleo y
+    los núcleos que bajan de la frecuencia base (hasta `max_cores`).
+    """
+    lines = [
+        f"cpu_clocks.txt: {result['cores']} núcleos x {result['captures']} capturas; "
+        f"mínimo por núcleo p5 {np.percentile(result['min'], 5):.0f} / mediana {np.median(result['min']):.0f} MHz, "
+        f"mediana global {np.median(result['p50']):.0f} MHz"
+    ]
+    edges, counts = np.unique(np.floor(result["min"] / 100) * 100, return_counts=True)
+    lines.append("Histograma de mínimos: " + ", ".join(f"{e:.0f}-{e + 99:.0f} MHz: {c}" for e, c in zip(edges, counts)))
+    if result["base_mhz"]:
+        flagged = np.flatnonzero(result["min"] < result["base_mhz"])
+        for core in flagged[:max_cores]:
+            lines.append(
+                f"Núcleo {core}: mín {result['min'][core]:.0f} / p5 {result['p5'][core]:.0f} / "
+                f"mediana {result['p50'][core]:.0f} MHz, {result['below_fraction'][core] * 100:.0f} % "
+                f"de capturas bajo {result['base_mhz']:.0f} MHz"
+            )
+        if len(flagged) > max_cores:
+            lines.append(f"... y {len(flagged) - max_cores} núcleos más por debajo de la base")
+    return lines
+
+# === Errores de hardware (journalctl.txt / bios.txt) ===
+# (subsistema, literal que se busca en el journal, expresión que confirma la línea)
+HW_ERROR_SIGNATURES = [
+    ("MCE",     b"Hardware Error]",             rb"."),
+    ("MCE",     b"Machine check events logged", rb"."),
+    ("NVRM",    b"NVRM: Xid",                   rb"."),
+    ("NVRM",    b"fallen off the bus",          rb"NVRM|nvidia"),
+    ("PCIe",    b"PCIe Bus Error",              rb"."),
+    ("PCIe",    b"AER: ",                       rb"AER: (?:Multiple )?(?:Corrected|Uncorrected)"),
+    ("EDAC",    b"EDAC ",                       rb"EDAC \S+: \d+ [CU]E "),
+    ("Thermal", b"temperature above threshold", rb"."),
+    ("Thermal", b"clock throttled",             rb"."),
+    ("Thermal", b"ritical temperature",         rb"."),
+]
+# Todas las firmas en una sola alternancia de literales (sin grupos, así `re` filtra
+# por el primer byte); el texto encontrado indica qué firma ha coincidido
+_HW_SCAN_RE = re.compile(b"|".join(re.escape(lit) for _, lit, _ in HW_ERROR_SIGNATURES))
+_HW_CHECKS = {lit: (sub, re.compile(check)) for sub, lit, check in HW_ERROR_SIGNATURES}
+_HW_TIMESTAMP_RE = re.compile(rb"^(\d{4}-\d\d-\d\dT\S+|\w{3} +\d+ \d\d:\d\d:\d\d)")
+_HW_DEVICE_RES = {
+    "MCE":     re.compile(rb"\b(CPU \d+|Bank \d+)"),
+    "NVRM":    re.compile(rb"\(PCI:([0-9a-fA-F:.]+)\)|GPU ([0-9a-fA-F]{4}:[0-9a-fA-F:.]+)"),
+    "PCIe":    re.compile(rb"\b([0-9a-fA-F]{4}:[0-9a-fA-F]{2}:[0-9a-fA-F]{2}\.[0-9a-fA-F])\b"),
+    "EDAC":    re.compile(rb"EDAC (\S+?):"),
+    "Thermal": re.compile(rb"\b(CPU\d+|Package|GPU \S+)"),
+}
+# dmidecode: bloques de error de memoria con tipo distinto de OK y sondas en estado crítico
+_BIOS_ERROR_RES = [
+    ("DMI-MEM", re.compile(r"Handle (0x[0-9A-F]+).*\n.*Memory Error Information\n\tType: (?!OK\b)(.+)")),
+    ("DMI",     re.compile(r"Handle (0x[0-9A-F]+).*\n(.+)\n(?:\t.*\n)*?\tStatus: (Critical|Non-recoverable|Invalid.*)")),
+]
+
+def scan_journal_errors(path):
+    """
+    Busca las firmas de HW_ERROR_SIGNATURES en el journal mapeado en memoria,
+    sin cargarlo entero y en una sola pasada, y agrupa las líneas por
+    (subsistema, dispositivo) con número de apariciones y primera/última marca
+    de tiempo.
+    """
+    groups = {}
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return groups
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while True:
+                hit = _HW_SCAN_RE.search(mm, pos)
+                if hit is None:
+                    break
+                line_start = mm.rfind(b"\n", 0, hit.start()) + 1
+                end = mm.find(b"\n", hit.start())
+                end = len(mm) if end == -1 else end
+                line = mm[line_start:end]
+                subsystem, check = _HW_CHECKS[hit.group()]
+                if not check.search(line):
+                    # Otra firma puede coincidir más adelante en la misma línea
+                    pos = hit.start() + 1
+                    continue
+                # Una línea cuenta una sola vez aunque contenga varias firmas
+                pos = end + 1
+                m = _HW_DEVICE_RES[subsystem].search(line)
+                device = next((g for g in m.groups() if g), b"-").decode() if m else "-"
+                ts = _HW_TIMESTAMP_RE.match(line)
+                ts = ts.group(1).decode() if ts else ""
+                g = groups.setdefault((subsystem, device), {
+                    "subsystem": subsystem, "device": device, "count": 0,
+                    "first": ts, "last": ts, "sample": line.decode("utf-8", errors="replace").strip()[:200],
+                })
+                g["count"] += 1
+                g["last"] = ts
+    return groups
+
+def scan_bios_errors(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    groups = {}
+    for subsystem, pat in _BIOS_ERROR_RES:
+        for m in pat.finditer(text):
+            device = m.group(1)
+            g = groups.setdefault((subsystem, device), {
+                "subsystem": subsystem, "device": device, "count": 0,
+                "first": "", "last": "", "sample": " ".join(x.strip() for x in m.groups()[1:]),
+            })
+            g["count"] += 1
+    return groups
+
+def scan_hardware_errors(reports_dir):
+    """
+    Errores de hardware de journalctl.txt y bios.txt, ordenados por subsistema y dispositivo.
+    """
+    groups = {}
+    journal = os.path.join(reports_dir, "journalctl.txt")
+    bios = os.path.join(reports_dir, "bios.txt")
+    if os.path.exists(journal):
+        groups.update(scan_journal_errors(journal))
+    if os.path.exists(bios):
+        groups.update(scan_bios_errors(bios))
+    return [groups[k] for k in sorted(groups)]
+
+def format_hardware_errors(errors):
+    if not errors:
+        return ["Sin errores de hardware en journalctl.txt ni bios.txt"]
+    lines = []
+    for e in errors:
+        when = f", {e['first']} -> {e['last']}" if e["first"] else ""
+        lines.append(f"{e['subsystem']} {e['device']}: {e['count']} aparición(es){when}: {e['sample']}")
+    return lines
+
+# === Reglas numéricas ===
+def parse_config_params(config_text):
+    """
+    Extrae los parámetros del bloque "Configuracion", p. ej.
+    "5. Mprime -> num_cpus: 2, frecuencia_base_mhz: 3000" -> {"Mprime": {"num_cpus": "2", ...}}.
+    """
+    params = {}
+    for line in config_text.splitlines():
+        m = re.match(r"\s*\d+\.\s*(.+?)\s*->\s*(.+)$", line)
+        if not m:
+            continue
+        name = m.group(1).strip()
+        # MprimeDesktop / MprimeServer comparten la sección "Mprime"
+        if name.lower().startswith("mprime"):
+            name = "Mprime"
+        values = {}
+        for item in m.group(2).split(","):
+            if ":" in item:
+                k, v = item.split(":", 1)
+                values[k.strip().lower()] = v.strip()
+        params[name] = values
+    return params
+
+def _first_number(value):
+    m = re.search(r"\d+(?:\.\d+)?", value or "")
+    return float(m.group(0)) if m else None
+
+def _normalize_gpu_name(name):
+    return re.sub(r"[^a-z0-9]", "", name.lower().replace("geforce", "").replace("nvidia", ""))
+
+def match_octane_reference(gpu_name):
+    """
+    Devuelve (nombre, puntuación) de la referencia más específica que contiene `gpu_name`.
+    """
+    gpu = _normalize_gpu_name(gpu_name)
+    candidates = [
+        (name, score) for name, score in reference_scores("octane")
+        if _normalize_gpu_name(name) and gpu.endswith(_normalize_gpu_name(name))
+    ]
+    return max(candidates, key=lambda c: len(_normalize_gpu_name(c[0])), default=None)
+
+def check_octane(text, ctx):
+    m = (re.search(r"La media por tarjeta gr\S+ es:\s*([\d.]+)", text)
+         or re.search(r"La puntuaci\S+ de las? tarjetas? gr\S+ es:\s*([\d.]+)", text))
+    if not m or not ctx["gpu_list"]:
+        return None
+    ref = match_octane_reference(ctx["gpu_list"][0])
+    if not ref:
+        return None
+    score = float(m.group(1))
+    name, ref_score = ref
+    diff = (score - ref_score) / ref_score * 100
+    ok = score >= ref_score * (1 - OCTANE_TOLERANCE)
+    return {
+        "verdict": "OK" if ok else "KO",
+        "lines": [
+            f"Puntuación media por GPU: {score:.2f}",
+            f"Referencia {name}: {ref_score:.2f} ({diff:+.1f} %, tolerancia {OCTANE_TOLERANCE * 100:.0f} %)",
+        ],
+    }
+
+def check_mprime(text, ctx):
+    base = _first_number(ctx["params"].get("Mprime", {}).get("frecuencia_base_mhz"))
+    freqs = re.findall(r"Promedio de frecuencias capturadas:\s*([\d.]+)\s*MHz", text)
+    if base is None or not freqs:
+        return None
+    final = float(freqs[-1])
+    minimum = min(float(f) for f in freqs)
+    ok = final >= base and not re.search(r"resultado KO", text, re.I)
+    lines = [
+        f"Frecuencia media final: {final:.2f} MHz (mínimo parcial {minimum:.2f} MHz)",
+        f"Frecuencia base configurada: {base:.0f} MHz",
+    ]
+    clocks = ctx.get("cpu_clocks")
+    if clocks:
+        lines += format_cpu_clocks(clocks)
+        # Un núcleo que pasa buena parte de la prueba bajo la base es un fallo aunque la media cumpla
+        ok = ok and not (clocks["below_fraction"] > CPU_MAX_BELOW_BASE).any()
+    return {"verdict": "OK" if ok else "KO", "lines": lines}
+
+def check_gpu_burn(text, ctx):
+    base = _first_number(ctx["params"].get("GPU-BURN", {}).get("clock base"))
+    gpus = re.findall(r"GPU - (\d+): Promedio de MHz \(100 %\):\s*([\d.]+)", text)
+    telemetry = ctx.get("gpu_telemetry") or {}
+    if not gpus:
+        # Sin resumen en el log se usa la mediana bajo carga de results_N.txt
+        gpus = [(str(gpu), st["clock_median"]) for gpu, st in telemetry.items()]
+    if base is None or not gpus:
+        return None
+    lines = [f"Clock base configurado: {base:.0f} MHz"]
+    ok = True
+    for gpu, mhz in gpus:
+        mhz = float(mhz)
+        below = mhz < base
+        ok = ok and not below
+        lines.append(f"GPU {gpu}: {mhz:.2f} MHz{' (por debajo de la base)' if below else ''}")
+    lines += format_gpu_telemetry(telemetry)
+    return {"verdict": "OK" if ok else "KO", "lines": lines}
 
-    sections = parse_log_sections(content)
+def check_stream(text, ctx):
+    values = {}
+    for metric, mbs in re.findall(r"^(Copy|Scale|Add|Triad):\s*([\d.]+)\s*MB/s", text, re.M):
+        values.setdefault(metric, []).append(float(mbs))
+    if not values:
+        return None
+    lines = []
+    ok = True
+    for metric in ("Copy", "Scale", "Add", "Triad"):
+        vals = sorted(values.get(metric, []))
+        if not vals:
+            continue
+        median = vals[len(vals) // 2]
+        low = vals[0]
+        below = low < median * (1 - STREAM_MAX_DEVIATION)
+        ok = ok and not below
+        lines.append(f"{metric}: mediana {median:.1f} MB/s, mínimo {low:.1f} MB/s, máximo {vals[-1]:.1f} MB/s"
+                     f"{' (variación notable)' if below else ''}")
+    return {"verdict": "OK" if ok else "KO", "lines": lines}
+
+def check_comprobaciones(text, ctx):
+    # Sin errores en el journal la sección sigue yendo al LLM para revisar el dispositivo PCI
+    errors = ctx.get("hw_errors")
+    if not errors:
+        return None
+    return {"verdict": "KO", "lines": format_hardware_errors(errors)}
+
+NUMERIC_RULES = {
+    "Octane":     check_octane,
+    "Mprime":     check_mprime,
+    "GPU-BURN":   check_gpu_burn,
+    "Anchobanda": check_stream,
+    "Comprobaciones": check_comprobaciones,
+}
+
+def evaluate_numeric_rules(bench, text, ctx):
+    """
+    Aplica la regla numérica de la sección. Devuelve {"verdict", "lines"} o None si no decide.
+    """
+    rule = NUMERIC_RULES.get(bench)
+    result = rule(text, ctx) if rule else None
+    if result and ctx.get("history"):
+        # Un valor muy por debajo de las máquinas iguales es un fallo aunque cumpla la regla fija
+        lines = format_fleet_comparison(ctx["history"], bench)
+        result["lines"] += lines
+        if any(c["outlier"] for m, c in ctx["history"].items() if HISTORY_METRICS[m][0] == bench):
+            result["verdict"] = "KO"
+    return result
+
+def format_rule_analysis(result):
+    lines = [f"Resultado {result['verdict']} (verificación numérica automática)"]
+    lines += [f"- {line}" for line in result["lines"]]
+    return "\n".join(lines)
+
+def build_run_context(sections, reports_dir=None):
+    """
+    Datos comunes a todas las secciones: GPUs detectadas, parámetros de
+    "Configuracion" y, si existe la carpeta de reports, la telemetría de GPU
+    las frecuencias por núcleo y los errores de hardware del journal.
+    """
     valores = sections.get("Valores", "")
     m = re.search(r"- GPUs NVIDIA CUDA\s*:\s*\d+\s*\(([^)]+)\)", valores)
-    gpu_list = [g.strip() for g in m.group(1).split(",")] if m else []
+    gpu_list = [g.strip() for g in m.group(1).split(",") if g.strip()] if m else []
+    params = parse_config_params(sections.get("Configuracion", ""))
+    base_clock = _first_number(params.get("GPU-BURN", {}).get("clock base"))
+    m = re.search(r"- CPUs disponibles\s*:\s*(\d+)", valores)
+    num_cores = int(m.group(1)) if m else 0
+    cpu_clocks_path = os.path.join(reports_dir, "cpu_clocks.txt") if reports_dir else None
+    cpu_clocks = None
+    if cpu_clocks_path and os.path.exists(cpu_clocks_path):
+        base_mhz = _first_number(params.get("Mprime", {}).get("frecuencia_base_mhz"))
+        cpu_clocks = analyze_cpu_clocks(cpu_clocks_path, num_cores, base_mhz)
+    return {
+        "gpu_list": gpu_list,
+        "params": params,
+        "gpu_telemetry": load_gpu_telemetry(reports_dir, base_clock) if reports_dir else {},
+        "cpu_clocks": cpu_clocks,
+        "hw_errors": scan_hardware_errors(reports_dir) if reports_dir else None,
+    }
 
-    analyses = {}
-    for bench, text in sections.items():
-        if not text.strip():
+# === Histórico de resultados (SQLite) ===
+# Métricas guardadas por ejecución: (sección, columna que define "máquina igual",
+# mayor es mejor, unidad, descripción)
+HISTORY_METRICS = {
+    "octane_per_gpu": ("Octane",     "gpu_model", True,  "",     "Octane por GPU"),
+    "gpu_clock_mhz":  ("GPU-BURN",   "gpu_model", True,  "MHz",  "Clock GPU bajo carga (mínimo entre GPUs)"),
+    "gpu_temp_max":   ("GPU-BURN",   "gpu_model", False, "°C",   "Temperatura máxima de GPU"),
+    "stream_copy":    ("Anchobanda", "cpu_model", True,  "MB/s", "STREAM Copy (mediana)"),
+    "stream_scale":   ("Anchobanda", "cpu_model", True,  "MB/s", "STREAM Scale (mediana)"),
+    "stream_add":     ("Anchobanda", "cpu_model", True,  "MB/s", "STREAM Add (mediana)"),
+    "stream_triad":   ("Anchobanda", "cpu_model", True,  "MB/s", "STREAM Triad (mediana)"),
+    "mprime_mhz":     ("Mprime",     "cpu_model", True,  "MHz",  "Frecuencia media final de Mprime"),
+    "fio_write":      ("FIO",        "cpu_model", True,  "MiB/s", "FIO escritura (mediana entre discos)"),
+    "fio_read":       ("FIO",        "cpu_model", True,  "MiB/s", "FIO lectura (mediana entre discos)"),
+}
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY,
+    serial       TEXT NOT NULL,
+    run_at       TEXT NOT NULL,
+    log_sha256   TEXT NOT NULL,
+    gpu_model    TEXT,
+    gpu_count    INTEGER,
+    cpu_model    TEXT,
+    bios_version TEXT,
+    board        TEXT,
+    status       TEXT,
+    UNIQUE (serial, log_sha256)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_serial ON runs (serial, run_at);
+CREATE INDEX IF NOT EXISTS idx_runs_gpu    ON runs (gpu_model, run_at);
+CREATE INDEX IF NOT EXISTS idx_runs_cpu    ON runs (cpu_model, run_at);
+CREATE INDEX IF NOT EXISTS idx_runs_bios   ON runs (bios_version, run_at);
+CREATE INDEX IF NOT EXISTS idx_runs_date   ON runs (run_at);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    value  REAL NOT NULL,
+    PRIMARY KEY (run_id, metric)
+);
+CREATE TABLE IF NOT EXISTS reference (
+    metric      TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    value       REAL NOT NULL,
+    source      TEXT,
+    imported_at TEXT NOT NULL,
+    PRIMARY KEY (metric, model)
+);
+"""
+
+_history_enabled = True
+_history_db = None
+_history_lock = threading.Lock()
+_reference_cache = {}
+
+def get_history_db():
+    """
+    Conexión compartida a HISTORY_DB_PATH (se crea el esquema la primera vez e
+    importa REFERENCE_DATA_FILE si aún no hay referencias). None si está
+    desactivado o no se puede abrir.
+    """
+    global _history_db, _history_enabled
+    if not _history_enabled:
+        return None
+    with _history_lock:
+        if _history_db is None:
+            try:
+                os.makedirs(os.path.dirname(HISTORY_DB_PATH) or ".", exist_ok=True)
+                db = sqlite3.connect(HISTORY_DB_PATH, timeout=30, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA foreign_keys=ON")
+                db.executescript(HISTORY_SCHEMA)
+                if db.execute("SELECT 1 FROM reference LIMIT 1").fetchone() is None \
+                        and os.path.exists(REFERENCE_DATA_FILE):
+                    _store_reference_rows(db, _read_reference_csv(REFERENCE_DATA_FILE))
+                _history_db = db
+            except (sqlite3.Error, OSError, ValueError) as e:
+                print("No se pudo abrir el histórico de resultados:", e)
+                _history_enabled = False
+                return None
+    return _history_db
+
+def _read_reference_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(r["metric"].strip(), r["model"].strip(), float(r["value"]), (r.get("source") or "").strip())
+                for r in csv.DictReader(f) if r.get("metric") and r.get("model") and r.get("value")]
+
+def import_reference_data(path):
+    """
+    Importa (o actualiza) datos de referencia desde un CSV con columnas
+    metric,model,value[,source]. Devuelve el número de filas importadas.
+    """
+    rows = _read_reference_csv(path)
+    db = get_history_db()
+    if db is None:
+        return 0
+    with _history_lock:
+        _store_reference_rows(db, rows)
+    _reference_cache.clear()
+    return len(rows)
+
+def _store_reference_rows(db, rows):
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with db:
+        db.executemany(
+            "INSERT INTO reference (metric, model, value, source, imported_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (metric, model) DO UPDATE SET value = excluded.value, "
+            "source = excluded.source, imported_at = excluded.imported_at",
+            [(m, model, v, src, now) for m, model, v, src in rows])
+
+def reference_scores(metric):
+    """
+    [(modelo, valor)] de referencia para `metric`, de mayor a menor. Sin
+    histórico disponible se leen directamente de REFERENCE_DATA_FILE.
+    """
+    if metric not in _reference_cache:
+        db = get_history_db()
+        if db is not None:
+            with _history_lock:
+                rows = db.execute("SELECT model, value FROM reference WHERE metric = ? ORDER BY value DESC",
+                                  (metric,)).fetchall()
+        elif os.path.exists(REFERENCE_DATA_FILE):
+            rows = sorted(((model, v) for m, model, v, _ in _read_reference_csv(REFERENCE_DATA_FILE) if m == metric),
+                          key=lambda r: -r[1])
+        else:
+            rows = []
+        _reference_cache[metric] = rows
+    return _reference_cache[metric]
+
+def _median(values):
+    return float(np.median(values)) if values else None
+
+def extract_run_metrics(sections, ctx):
+    """
+    Valores numéricos de la ejecución que se guardan en el histórico (HISTORY_METRICS).
+    """
+    metrics = {}
+    m = re.search(r"La media por tarjeta gr\S+ es:\s*([\d.]+)", sections.get("Octane", ""))
+    if m:
+        metrics["octane_per_gpu"] = float(m.group(1))
+    stream = {}
+    for metric, mbs in re.findall(r"^(Copy|Scale|Add|Triad):\s*([\d.]+)\s*MB/s", sections.get("Anchobanda", ""), re.M):
+        stream.setdefault(f"stream_{metric.lower()}", []).append(float(mbs))
+    metrics.update({k: _median(v) for k, v in stream.items()})
+    freqs = re.findall(r"Promedio de frecuencias capturadas:\s*([\d.]+)\s*MHz", sections.get("Mprime", ""))
+    if freqs:
+        metrics["mprime_mhz"] = float(freqs[-1])
+    burn = sections.get("GPU-BURN", "")
+    clocks = [float(v) for v in re.findall(r"GPU - \d+: Promedio de MHz \(100 %\):\s*([\d.]+)", burn)]
+    telemetry = ctx.get("gpu_telemetry") or {}
+    if not clocks:
+        clocks = [st["clock_median"] for st in telemetry.values()]
+    if clocks:
+        metrics["gpu_clock_mhz"] = min(clocks)
+    if telemetry:
+        metrics["gpu_temp_max"] = max(st["temp_max"] for st in telemetry.values())
+    fio = sections.get("FIO", "")
+    for kind, key in (("escritura", "fio_write"), ("lectura", "fio_read")):
+        values = [float(v) for v in re.findall(rf"Velocidad de {kind} en \S+: bw=([\d.]+)MiB/s", fio)]
+        if values:
+            metrics[key] = _median(values)
+    return metrics
+
+def extract_run_info(serial, log_path, sections, ctx, reports_dir=None):
+    """
+    Identidad de la máquina para agrupar "máquinas iguales": modelos de GPU y
+    CPU, BIOS y placa base.
+    """
+    valores = sections.get("Valores", "")
+    m = re.search(r"- Modelo de CPU:\s*(.+)", valores)
+    board = re.search(r"- Placa base:\s*(.+)", valores)
+    bios = None
+    bios_path = os.path.join(reports_dir, "bios.txt") if reports_dir else None
+    if bios_path and os.path.exists(bios_path):
+        with open(bios_path, "r", encoding="utf-8", errors="replace") as f:
+            bm = re.search(r"BIOS Information.*?Version:\s*(.+?)\s*$", f.read(), re.S | re.M)
+        bios = bm.group(1) if bm else None
+    gpu_list = ctx.get("gpu_list") or []
+    return {
+        "serial": serial,
+        "run_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(os.path.getmtime(log_path))),
+        "gpu_model": gpu_list[0] if gpu_list else None,
+        "gpu_count": len(gpu_list),
+        "cpu_model": m.group(1).strip() if m else None,
+        "bios_version": bios,
+        "board": board.group(1).strip() if board else None,
+    }
+
+def fleet_baseline(metric, info, limit=HISTORY_LAST_RUNS):
+    """
+    Valores de `metric` en las últimas `limit` máquinas iguales (mismo modelo
+    de GPU o CPU según la métrica), sin contar las ejecuciones de esta misma máquina.
+    """
+    db = get_history_db()
+    column = HISTORY_METRICS[metric][1]
+    if db is None or not info.get(column):
+        return []
+    with _history_lock:
+        rows = db.execute(
+            f"SELECT m.value FROM runs r JOIN metrics m ON m.run_id = r.id AND m.metric = ? "
+            f"WHERE r.{column} = ? AND r.serial != ? ORDER BY r.run_at DESC LIMIT ?",
+            (metric, info[column], info["serial"], limit)).fetchall()
+    return [v for (v,) in rows]
+
+def compare_with_fleet(metrics, info):
+    """
+    Compara cada métrica con la línea base de su grupo: mediana y banda p10-p90.
+    Devuelve {métrica: {...}} solo para las métricas con HISTORY_MIN_RUNS máquinas o más.
+    """
+    out = {}
+    for metric, value in metrics.items():
+        values = fleet_baseline(metric, info)
+        if len(values) < HISTORY_MIN_RUNS:
             continue
-        tpl = get_octane_prompt(gpu_list) if bench == "Octane" else get_prompt_template(bench)
-        prompt = (
-            f"{tpl}\n\n"
-            f"Sección '{bench}':\n\n{text}\n\n"
-            "Proporciona un análisis detallado, razonado y bien estructurado en español."
-        )
-        analysis = run_ollama_analysis(MODEL_NAME, prompt) or f"Error al analizar {bench}."
-        analyses[bench] = analysis
+        p10, median, p90 = (float(x) for x in np.percentile(values, [10, 50, 90]))
+        higher_better = HISTORY_METRICS[metric][2]
+        if higher_better:
+            outlier = value < p10 * (1 - HISTORY_TOLERANCE)
+        else:
+            outlier = value > p90 * (1 + HISTORY_TOLERANCE)
+        out[metric] = {"value": value, "n": len(values), "median": median,
+                       "p10": p10, "p90": p90, "outlier": bool(outlier)}
+    return out
+
+def attach_history(ctx, serial, log_path, sections, reports_dir=None):
+    """
+    Añade al contexto la identidad de la máquina, sus métricas y la comparativa con la flota.
+    """
+    info = extract_run_info(serial, log_path, sections, ctx, reports_dir)
+    metrics = extract_run_metrics(sections, ctx)
+    ctx["run_info"] = info
+    ctx["metrics"] = metrics
+    ctx["history"] = compare_with_fleet(metrics, info) if _history_enabled else {}
+    return ctx
 
-        if is_abnormal(analysis):
-            msg = f"<@{ADMIN_ID}> posible incidencia en **{bench}**:\n{analysis}"
+def record_run(ctx, log_sha256, status):
+    """
+    Guarda la ejecución y sus métricas en el histórico (sustituye la anterior del mismo log).
+    """
+    db = get_history_db()
+    info = ctx.get("run_info")
+    if db is None or not info:
+        return
+    try:
+        with _history_lock, db:
+            db.execute(
+                "INSERT INTO runs (serial, run_at, log_sha256, gpu_model, gpu_count, cpu_model, bios_version, board, status) "
+                "VALUES (:serial, :run_at, :log_sha256, :gpu_model, :gpu_count, :cpu_model, :bios_version, :board, :status) "
+                "ON CONFLICT (serial, log_sha256) DO UPDATE SET status = excluded.status, run_at = excluded.run_at",
+                {**info, "log_sha256": log_sha256, "status": status})
+            run_id = db.execute("SELECT id FROM runs WHERE serial = ? AND log_sha256 = ?",
+                                (info["serial"], log_sha256)).fetchone()[0]
+            db.execute("DELETE FROM metrics WHERE run_id = ?", (run_id,))
+            db.executemany("INSERT INTO metrics (run_id, metric, value) VALUES (?, ?, ?)",
+                           [(run_id, k, v) for k, v in ctx.get("metrics", {}).items() if v is not None])
+    except sqlite3.Error as e:
+        print("No se pudo guardar la ejecución en el histórico:", e)
+
+def format_fleet_comparison(history, bench=None):
+    """
+    Líneas "esta máquina frente a las últimas N iguales" (solo las de `bench` si se indica).
+    """
+    lines = []
+    for metric, c in history.items():
+        section, _, _, unit, label = HISTORY_METRICS[metric]
+        if bench and section != bench:
+            continue
+        unit = f" {unit}" if unit else ""
+        lines.append(f"{label}: {c['value']:.1f}{unit} frente a mediana {c['median']:.1f}{unit} "
+                     f"(p10-p90 {c['p10']:.1f}-{c['p90']:.1f}) de las últimas {c['n']} máquinas iguales"
+                     f"{' (fuera de la banda habitual)' if c['outlier'] else ''}")
+    return lines
+
+def fleet_comparison_rows(history):
+    """
+    Filas de la tabla del PDF: [métrica, valor, mediana, banda, N, estado].
+    """
+    rows = []
+    for metric, c in history.items():
+        _, _, _, unit, label = HISTORY_METRICS[metric]
+        rows.append([label + (f" ({unit})" if unit else ""), f"{c['value']:.1f}", f"{c['median']:.1f}",
+                     f"{c['p10']:.1f} - {c['p90']:.1f}", str(c["n"]), "Fuera de banda" if c["outlier"] else "OK"])
+    return rows
+
+# === Compactación de prompts ===
+# Secuencias ANSI; sin ESC (capturas que lo pierden) solo se quitan los códigos de color con algún número
+_ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]|\[[0-9;]*[0-9][0-9;]*m")
+# Líneas de ruido que se repiten con pequeñas variaciones (fechas, números)
+NOISE_LINE_PATTERNS = re.compile(
+    r"FATAL:nvml_library\.cpp|\d+ warnings? generated|store\.primatelabs\.com|"
+    r"^https://www\.geekbench\.com/?$|^Tiempo transcurrido:|^Summary at:|"
+    r"^Ejecutando STREAM Benchmark en la CPU|^Pruebas completadas en la CPU"
+)
+# Líneas que la truncación intenta conservar aunque caigan en la parte omitida
+IMPORTANT_LINE_RE = re.compile(r"(?i)error|fail|fallo|anomal|cr[ií]tic|\bKO\b|warning|por debajo")
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+def compact_section_text(text, token_budget=SECTION_TOKEN_BUDGET):
+    """
+    Prepara el texto de una sección para el prompt: quita códigos ANSI y líneas
+    vacías, agrupa las repeticiones consecutivas de una línea (y del ruido casi
+    idéntico) con su número de apariciones y, si aún supera `token_budget`,
+    conserva el principio, el final y las líneas con errores. Las líneas no se
+    reordenan: una lectura que se repite más adelante sigue en su sitio.
+    Devuelve (texto, tokens_antes, tokens_después).
+    """
+    before = estimate_tokens(text)
+    runs = []  # [clave, primera línea, apariciones seguidas]
+    for raw in text.splitlines():
+        line = _ANSI_RE.sub("", raw).strip()
+        if not line:
+            continue
+        key = re.sub(r"\d+", "#", line) if NOISE_LINE_PATTERNS.search(line) else line
+        if runs and runs[-1][0] == key:
+            runs[-1][2] += 1
         else:
-            msg = f"**{bench}:**\n{analysis}"
-        send_long_message(thread_id, msg)
-        time.sleep(2)
+            runs.append([key, line, 1])
+    lines = [line if count == 1 else f"{line} [x{count}]" for _, line, count in runs]
+
+    budget = token_budget * 4
+    if sum(len(l) + 1 for l in lines) > budget:
+        lines = _truncate_lines(lines, budget)
+    compacted = "\n".join(lines) + "\n"
+    return compacted, before, estimate_tokens(compacted)
 
+def _truncate_lines(lines, budget):
+    """
+    Mantiene ~50 % del presupuesto del principio, ~30 % del final y el resto
+    para líneas importantes del medio, marcando los huecos omitidos.
+    """
+    keep = set()
+    used = 0
+    for i, line in enumerate(lines):
+        if used + len(line) + 1 > budget * 0.5:
+            break
+        keep.add(i)
+        used += len(line) + 1
+    tail_used = 0
+    for i in range(len(lines) - 1, -1, -1):
+        if i in keep or tail_used + len(lines[i]) + 1 > budget * 0.3:
+            break
+        keep.add(i)
+        tail_used += len(lines[i]) + 1
+    used += tail_used
+    for i, line in enumerate(lines):
+        if i not in keep and IMPORTANT_LINE_RE.search(line) and used + len(line) + 1 <= budget:
+            keep.add(i)
+            used += len(line) + 1
+    result = []
+    skipped = 0
+    for i, line in enumerate(lines):
+        if i in keep:
+            if skipped:
+                result.append(f"[... {skipped} líneas omitidas ...]")
+                skipped = 0
+            result.append(line)
+        else:
+            skipped += 1
+    if skipped:
+        result.append(f"[... {skipped} líneas omitidas ...]")
+    return result
+
+def build_section_prompt(bench, text, gpu_list, closing=None):
+    """
+    Compone el prompt completo de una sección. `closing` sustituye la instrucción final.
+    """
+    tpl = get_octane_prompt(gpu_list) if bench == "Octane" else get_prompt_template(bench)
+    closing = closing or "Proporciona un análisis detallado, razonado y bien estructurado en español."
+    return (
+        f"{tpl}\n\n"
+        f"Sección '{bench}':\n\n{text}\n\n"
+        f"{closing}"
+    )
+
+# === Veredictos estructurados (JSON) ===
+VERDICT_SEVERITIES = ("ninguna", "baja", "media", "alta", "critica")
+
+VERDICT_JSON_INSTRUCTIONS = (
+    "Responde ÚNICAMENTE con un objeto JSON con estas claves:\n"
+    '- "verdict": "OK" si los resultados son correctos o "ANOMALIA" si indican un error, anomalía '
+    "o fallo de hardware/configuración.\n"
+    '- "severity": una de "ninguna", "baja", "media", "alta" o "critica".\n'
+    '- "values": objeto con los valores extraídos del log (nombre: valor), copiados textualmente.\n'
+    '- "narrative": análisis detallado, razonado y bien estructurado en español.'
+)
+
+TRIAGE_JSON_INSTRUCTIONS = (
+    "Haz una revisión rápida. Responde ÚNICAMENTE con un objeto JSON con estas claves:\n"
+    '- "verdict": "OK" si todo es correcto o "ANOMALIA" ante cualquier indicio de error, fallo '
+    "o valor fuera de lo esperado.\n"
+    '- "values": objeto con los valores principales extraídos del log (nombre: valor).\n'
+    '- "narrative": resumen de una o dos frases en español.'
+)
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.S)
+
+def parse_structured_verdict(raw):
+    """
+    Valida la respuesta JSON del modelo. Devuelve {"verdict", "severity", "values", "narrative"}
+    o None si no es un objeto con un veredicto reconocible.
+    """
     try:
-        pdf_path = generate_pdf_report(serial, analyses)
-        send_file_to_channel(thread_id, pdf_path, content="Adjunto informe completo en PDF.")
-    except Exception as e:
-        print("Error generando/enviando PDF:", e)
+        data = json.loads(raw)
+    except ValueError:
+        # Algunos modelos envuelven el objeto en texto o en un bloque ```json
+        m = _JSON_OBJECT_RE.search(raw)
+        try:
+            data = json.loads(m.group(0)) if m else None
+        except ValueError:
+            data = None
+    if not isinstance(data, dict):
+        return None
+    verdict = str(data.get("verdict", "")).strip().upper().replace("Í", "I")
+    if verdict == "KO":
+        verdict = "ANOMALIA"
+    if verdict not in ("OK", "ANOMALIA"):
+        return None
+    severity = str(data.get("severity") or "").strip().lower().replace("í", "i")
+    if severity not in VERDICT_SEVERITIES:
+        severity = "ninguna" if verdict == "OK" else "media"
+    values = data.get("values")
+    if isinstance(values, list):
+        values = {str(i + 1): v for i, v in enumerate(values)}
+    if not isinstance(values, dict):
+        values = {}
+    narrative = data.get("narrative")
+    return {
+        "verdict": verdict,
+        "severity": severity,
+        "values": {str(k): v for k, v in values.items()},
+        "narrative": narrative.strip() if isinstance(narrative, str) else "",
+    }
+
+def format_structured_analysis(result, model):
+    """
+    Texto publicado para un veredicto estructurado: narrativa, valores y veredicto.
+    """
+    lines = [result["narrative"]] if result["narrative"] else []
+    if result["values"]:
+        lines.append("\nValores extraídos:")
+        for name, value in result["values"].items():
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            lines.append(f"- {name}: {value}")
+    lines.append(f"\nResultado {'KO' if result['verdict'] == 'ANOMALIA' else 'OK'} "
+                 f"(gravedad: {result['severity']}; {model})")
+    return "\n".join(lines)
+
+def request_structured_verdict(model, prompt):
+    """
+    Una sola generación en modo JSON. Devuelve (resultado, texto) donde resultado
+    es None si la respuesta está vacía o no es un JSON válido.
+    """
+    raw = run_ollama_analysis(model, prompt, format="json", options={"temperature": 0})
+    return (parse_structured_verdict(raw) if raw else None), raw
+
+def structured_analysis(bench, text, gpu_list, m):
+    """
+    Análisis y veredicto de una sección con una sola llamada por modelo.
+    Con TRIAGE_MODEL, el modelo pequeño revisa antes la sección: si la da por buena
+    se publica su resumen y solo las sospechosas llegan a MODEL_NAME.
+    Devuelve (analysis, abnormal) o None si el LLM no responde.
+    """
+    prompt = build_section_prompt(bench, text, gpu_list, VERDICT_JSON_INSTRUCTIONS)
+    key = cache_key("verdict_json", TRIAGE_MODEL, MODEL_NAME, prompt)
+    cached = cache_get(key)
+    if cached is not None:
+        m["source"] = "cache"
+        return cached["analysis"], cached["abnormal"]
+    result = None
+    if TRIAGE_MODEL:
+        triage, _ = request_structured_verdict(
+            TRIAGE_MODEL, build_section_prompt(bench, text, gpu_list, TRIAGE_JSON_INSTRUCTIONS))
+        m["triage"] = triage["verdict"] if triage else "error"
+        if triage and triage["verdict"] == "OK":
+            result, model = triage, TRIAGE_MODEL
+            m["source"] = "triage"
+    if result is None:
+        model = MODEL_NAME
+        result, raw = request_structured_verdict(MODEL_NAME, prompt)
+        m["source"] = "llm"
+        if result is None:
+            if not raw:
+                return None
+            # JSON no válido: el texto se publica tal cual y el veredicto se pide aparte
+            abnormal = is_abnormal(raw)
+            result = {"verdict": "ANOMALIA" if abnormal else "OK", "severity": "media" if abnormal else "ninguna",
+                      "values": {}, "narrative": raw}
+            m["source"] = "llm_text"
+    m["severity"] = result["severity"]
+    analysis = format_structured_analysis(result, model)
+    abnormal = result["verdict"] == "ANOMALIA"
+    cache_put(key, {"analysis": analysis, "abnormal": abnormal,
+                    "severity": result["severity"], "values": result["values"]})
+    return analysis, abnormal
+
+# Texto publicado cuando el LLM no responde; no se guarda en caché ni en el diario
+ANALYSIS_ERROR = "Error al analizar {}."
+
+def analyze_section(bench, text, ctx):
+    """
+    Etapa LLM de una sección: análisis y veredicto. Devuelve (analysis, abnormal).
+    Las secciones que las reglas numéricas pueden decidir no llegan al modelo.
+    """
+    with span("analyze_section", section=bench, input_chars=len(text)) as m:
+        if USE_NUMERIC_RULES:
+            result = evaluate_numeric_rules(bench, text, ctx)
+            if result:
+                m["source"] = "rules"
+                return format_rule_analysis(result), result["verdict"] == "KO"
+        text, before, after = compact_section_text(text)
+        ctx.setdefault("prompt_tokens", {})[bench] = (before, after)
+        m["tokens_before"], m["tokens_after"] = before, after
+        if bench == "GPU-BURN" and ctx.get("gpu_telemetry"):
+            text += "\nTelemetría de results_N.txt:\n" + "\n".join(format_gpu_telemetry(ctx["gpu_telemetry"])) + "\n"
+        if bench == "Comprobaciones" and ctx.get("hw_errors") is not None:
+            text += "\nErrores de hardware:\n" + "\n".join(format_hardware_errors(ctx["hw_errors"])) + "\n"
+        if bench == "Mprime" and ctx.get("cpu_clocks"):
+            text += "\nFrecuencias por núcleo:\n" + "\n".join(format_cpu_clocks(ctx["cpu_clocks"])) + "\n"
+        fleet = format_fleet_comparison(ctx.get("history") or {}, bench)
+        if fleet:
+            text += "\nComparativa con máquinas iguales:\n" + "\n".join(fleet) + "\n"
+        if USE_JSON_VERDICTS:
+            result = structured_analysis(bench, text, ctx["gpu_list"], m)
+            if result is None:
+                m["source"] = "error"
+                return ANALYSIS_ERROR.format(bench), True
+            return result
+        prompt = build_section_prompt(bench, text, ctx["gpu_list"])
+        key = cache_key("analysis", MODEL_NAME, prompt)
+        cached = cache_get(key)
+        if cached is not None:
+            m["source"] = "cache"
+            return cached["analysis"], cached["abnormal"]
+        m["source"] = "llm"
+        analysis = run_ollama_analysis(MODEL_NAME, prompt)
+        if not analysis:
+            # Los fallos no se guardan para que el siguiente intento vuelva a llamar al LLM,
+            # ni se consulta otra vez al modelo que acaba de fallar
+            m["source"] = "error"
+            return ANALYSIS_ERROR.format(bench), True
+        abnormal = is_abnormal(analysis)
+        cache_put(key, {"analysis": analysis, "abnormal": abnormal})
+        return analysis, abnormal
+
+def section_message(bench, analysis, abnormal, update=False):
+    """
+    Texto publicado para una sección. `update` indica que la sección ya se
+    publicó y su análisis ha cambiado.
+    """
+    title = f"{bench} (actualizado)" if update else bench
+    if abnormal:
+        return f"<@{ADMIN_ID}> posible incidencia en **{title}**:\n{analysis}"
+    return f"**{title}:**\n{analysis}"
+
+def deliver_section(thread_id, bench, analysis, abnormal, posted=None, on_post=None, update=False):
+    """
+    Etapa de entrega: publica el análisis de una sección en el hilo.
+    Devuelve los ids de los mensajes o None si la entrega quedó incompleta.
+    """
+    msg = section_message(bench, analysis, abnormal, update)
+    with span("deliver", section=bench, chars=len(msg)):
+        return send_long_message(thread_id, msg, posted=posted, on_post=on_post)
+
+# === Diario de ejecución (reanudación por serial) ===
+# Bytes iniciales del log que identifican la ejecución (estables aunque el log siga creciendo)
+JOURNAL_PREFIX_BYTES = 4096
+# Datos del contexto de los que depende cada sección además de su texto
+SECTION_CONTEXT_DEPS = {
+    "Octane":          ("gpu_list",),
+    "Mprime":          ("params", "cpu_clocks"),
+    "GPU-BURN":        ("params", "gpu_telemetry"),
+    "Comprobaciones":  ("hw_errors",),
+}
+
+def file_sha256(path, limit=None):
+    """
+    Hash SHA-256 del fichero, o de sus `limit` primeros bytes.
+    """
+    h = hashlib.sha256()
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            block = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not block:
+                break
+            h.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return h.hexdigest()
+
+def section_input_key(bench, text, ctx):
+    """
+    Huella de todo lo que determina el análisis de una sección: si no cambia,
+    el análisis guardado en el diario sigue valiendo.
+    """
+    deps = {k: ctx.get(k) for k in SECTION_CONTEXT_DEPS.get(bench, ())}
+    return cache_key(bench, text, json.dumps(deps, sort_keys=True, default=str))
+
+class RunJournal:
+    """
+    Estado persistente de una máquina en "<serial>_journal.json" junto al log:
+    hilo de Discord, análisis y veredicto de cada sección, mensajes publicados
+    y envío del PDF. Se reescribe de forma atómica tras cada paso, así una
+    ejecución interrumpida continúa donde se quedó.
+    Cada sección guarda la huella de su entrada (section_input_key): si el
+    texto o sus datos cambian se vuelve a analizar y a publicar. Los trozos ya
+    publicados se guardan con la huella del mensaje completo, así un texto
+    distinto nunca hereda los trozos de otro.
+    """
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, log_path, resume=True):
+        serial = serial_from_log_path(log_path)
+        path = os.path.join(os.path.dirname(log_path), f"{serial}_journal.json")
+        data = None
+        if resume:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = None
+            if data and file_sha256(log_path, data.get("log_prefix_len", 0)) != data.get("log_prefix_sha256"):
+                print(f"El log de {serial} es de otra ejecución; se descarta el diario anterior.")
+                data = None
+        if data is None:
+            prefix_len = min(os.path.getsize(log_path), JOURNAL_PREFIX_BYTES)
+            data = {"serial": serial, "thread_id": None,
+                    "log_prefix_len": prefix_len, "log_prefix_sha256": file_sha256(log_path, prefix_len),
+                    "log_sha256": None, "sections": {}, "messages": {}, "delivered": {},
+                    "pdf_sent": False, "status": None}
+        return cls(path, data)
+
+    def save(self):
+        with self._lock:
+            try:
+                write_json_atomic(self.path, self.data)
+            except OSError as e:
+                print("No se pudo escribir el diario de ejecución:", e)
+
+    def update(self, **fields):
+        with self._lock:
+            self.data.update(fields)
+        self.save()
+
+    def is_finished(self, log_sha256):
+        """True si la ejecución terminó y el log no ha cambiado desde entonces."""
+        return self.data["status"] in ("OK", "KO") and self.data["log_sha256"] == log_sha256
+
+    def reopen(self):
+        """El log cambió tras terminar: hay que revisar secciones y reenviar el PDF."""
+        if self.data["status"] is not None or self.data["pdf_sent"]:
+            self.update(status=None, log_sha256=None, pdf_sent=False)
+
+    def section(self, bench, input_key):
+        entry = self.data["sections"].get(bench)
+        if entry and entry.get("input") == input_key:
+            return entry["analysis"], entry["abnormal"]
+        return None
+
+    def record_section(self, bench, input_key, analysis, abnormal):
+        with self._lock:
+            self.data["sections"][bench] = {"input": input_key, "analysis": analysis, "abnormal": abnormal}
+        self.save()
+
+    def analyses(self):
+        """(análisis, veredictos) de las secciones guardadas, en el orden del diario."""
+        with self._lock:
+            sections = dict(self.data["sections"])
+        return ({b: e["analysis"] for b, e in sections.items()},
+                {b: e["abnormal"] for b, e in sections.items()})
+
+    def posted(self, bench, message_key):
+        with self._lock:
+            entry = self.data["messages"].get(bench, {})
+            return dict(entry.get("posted", {})) if entry.get("message") == message_key else {}
+
+    def record_posted(self, bench, message_key, posted):
+        with self._lock:
+            self.data["messages"][bench] = {"message": message_key, "posted": dict(posted)}
+        self.save()
+
+    def mark_delivered(self, bench, input_key):
+        with self._lock:
+            self.data["delivered"][bench] = input_key
+        self.save()
+
+    def is_delivered(self, bench, input_key):
+        return self.data["delivered"].get(bench) == input_key
+
+    def was_delivered(self, bench):
+        return bench in self.data["delivered"]
+
+def analyze_and_deliver(journal, thread_id, sections, ctx, concurrency=LLM_CONCURRENCY, on_progress=None):
+    """
+    Analiza `sections` (bench -> texto, en orden del log) con varias llamadas al
+    LLM a la vez y publica cada resultado en orden en el hilo, apoyándose en el
+    diario para no repetir análisis ni mensajes. Una sección ya publicada cuyo
+    texto o datos cambiaron se publica de nuevo como actualización.
+    `on_progress(etapa, hechas, total)` se llama tras cada sección.
+    Devuelve (análisis, veredictos, completo).
+    """
+    serial = journal.data["serial"]
+
+    def analyze_and_record(bench, text, key):
+        with span_labels(serial=serial):
+            analysis, abnormal = analyze_section(bench, text, ctx)
+        if analysis != ANALYSIS_ERROR.format(bench):
+            journal.record_section(bench, key, analysis, abnormal)
+        return analysis, abnormal
+
+    # Pipeline: el pool lanza las llamadas al LLM de varias secciones a la vez
+    # y la entrega publica cada resultado en el orden original del log.
+    analyses = {}
+    verdicts = {}
+    complete = True
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = []
+        for bench, text in sections.items():
+            if not text.strip():
+                continue
+            key = section_input_key(bench, text, ctx)
+            done = journal.section(bench, key)
+            futures.append((bench, key, done or pool.submit(analyze_and_record, bench, text, key)))
+        for n, (bench, key, future) in enumerate(futures, 1):
+            analysis, abnormal = future if isinstance(future, tuple) else future.result()
+            analyses[bench] = analysis
+            verdicts[bench] = abnormal
+            if on_progress:
+                on_progress("análisis", n, len(futures))
+            # Tras un fallo de entrega no se publica nada más, para conservar el orden
+            if journal.is_delivered(bench, key) or not complete:
+                continue
+            update = journal.was_delivered(bench)
+            journaled = journal.section(bench, key) is not None
+            # Un análisis que no está en el diario (error del LLM) se publica sin
+            # guardar sus trozos: la siguiente ejecución publicará el análisis real
+            posted, on_post = {}, None
+            if journaled:
+                msg_key = cache_key(section_message(bench, analysis, abnormal, update))
+                posted = journal.posted(bench, msg_key)
+                on_post = lambda b=bench, k=msg_key, p=posted: journal.record_posted(b, k, p)
+            ids = deliver_section(thread_id, bench, analysis, abnormal, posted=posted,
+                                  on_post=on_post, update=update)
+            if ids is None or not journaled:
+                complete = False
+            else:
+                journal.mark_delivered(bench, key)
+    return analyses, verdicts, complete
+
+def find_log_file():
+    """
+    Busca automáticamente el archivo de log final que cumpla "*_final.txt".
+    Devuelve None si no hay ninguno.
+    """
+    log_files = glob.glob("*_final.txt")
+    if not log_files:
+        print("No se encontró ningún archivo de log final.")
+        return None
+    if len(log_files) > 1:
+        print("Se encontraron varios archivos de log final; se usará el primero:", log_files[0])
+    return log_files[0]
+
+def serial_from_log_path(log_path):
+    basename = os.path.basename(log_path)
+    return basename[:-len("_final.txt")] if basename.endswith("_final.txt") else os.path.splitext(basename)[0]
+
+def find_reports_dir(log_path):
+    """
+    Devuelve la carpeta "<serial>_reports" junto al log, o None si no existe.
+    """
+    path = os.path.join(os.path.dirname(log_path), f"{serial_from_log_path(log_path)}_reports")
+    return path if os.path.isdir(path) else None
+
+def find_fleet_logs(root):
+    """
+    Recorre `root` y devuelve [(log, carpeta_reports)] de cada máquina, ordenados por ruta.
+    """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.endswith("_reports"))
+        for name in sorted(filenames):
+            if name.endswith("_final.txt"):
+                path = os.path.join(dirpath, name)
+                found.append((path, find_reports_dir(path)))
+    return found
+
+def finish_run(journal, thread_id, log_path, analyses, verdicts, complete, cpu_pool=None, ctx=None):
+    """
+    Cierre de una máquina: genera el PDF con los análisis ya calculados, lo
+    publica, guarda la ejecución en el histórico y marca el diario como
+    terminado. Devuelve "OK", "KO" o "ERROR".
+    """
+    serial = journal.data["serial"]
+    ctx = ctx or {}
+    fleet = fleet_comparison_rows(ctx.get("history") or {})
+    if complete and not journal.data["pdf_sent"]:
+        try:
+            output_dir = os.path.dirname(log_path)
+            with span("pdf", sections=len(analyses)) as m:
+                if cpu_pool:
+                    pdf_path = cpu_pool.submit(generate_pdf_report, serial, analyses, verdicts,
+                                               output_dir, fleet).result()
+                else:
+                    pdf_path = generate_pdf_report(serial, analyses, verdicts, output_dir, fleet)
+                m["bytes"] = os.path.getsize(pdf_path)
+            if send_file_to_channel(thread_id, pdf_path, content="Adjunto informe completo en PDF."):
+                journal.update(pdf_sent=True)
+            else:
+                complete = False
+        except Exception as e:
+            print("Error generando/enviando PDF:", e)
+            complete = False
+    if not complete:
+        print(f"{serial} quedó incompleto; la próxima ejecución continuará desde el diario.")
+        return "ERROR"
+    status = "KO" if any(verdicts.values()) else "OK"
+    log_sha256 = file_sha256(log_path)
+    with span("history"):
+        record_run(ctx, log_sha256, status)
+    journal.update(status=status, log_sha256=log_sha256)
+    return status
+
+def open_thread(journal):
+    """
+    Hilo de Discord de la máquina: el del diario o uno nuevo. None si falla.
+    """
+    serial = journal.data["serial"]
+    thread_id = journal.data["thread_id"]
+    if thread_id:
+        print(f"Reanudando {serial} en el hilo {thread_id}.")
+        return thread_id
+    thread_id = create_discord_thread(DISCORD_FORUM_CHANNEL_ID, f"Análisis {serial}")
+    if thread_id:
+        journal.update(thread_id=thread_id)
+    return thread_id
+
+def print_compaction(serial, ctx):
+    tokens = ctx.get("prompt_tokens", {}).values()
+    before, after = sum(t[0] for t in tokens), sum(t[1] for t in tokens)
+    if before:
+        print(f"Compactación de prompts ({serial}): {before} -> {after} tokens estimados "
+              f"({(before - after) / before * 100:.0f} % menos)")
+
+def process_log(log_path, concurrency=LLM_CONCURRENCY, cpu_pool=None, resume=True, on_progress=None):
+    """
+    Analiza un log completo: hilo en Discord, análisis por sección y PDF.
+    `cpu_pool` (ProcessPoolExecutor opcional) ejecuta el parseo y el PDF fuera
+    del proceso principal. Con `resume` se continúa desde el diario de la
+    ejecución anterior (hilo, análisis y mensajes ya publicados).
+    `on_progress(etapa, hechas, total)` recibe el avance (lo usa agent_service.py).
+    Devuelve un resumen {serial, status, elapsed}.
+    """
+    def progress(stage, done=0, total=0):
+        if on_progress:
+            on_progress(stage, done, total)
+
+    t0 = time.monotonic()
+    serial = serial_from_log_path(log_path)
+    summary = {"serial": serial, "status": "ERROR", "elapsed": 0.0}
+    with span("run", serial=serial) as m:
+        journal = RunJournal.load(log_path, resume)
+        if journal.is_finished(file_sha256(log_path)):
+            print(f"{serial} ya se procesó por completo (usa --fresh para repetirlo).")
+            summary["status"] = m["status"] = journal.data["status"]
+            return summary
+        journal.reopen()
+
+        progress("hilo")
+        thread_id = open_thread(journal)
+        if not thread_id:
+            summary["elapsed"] = time.monotonic() - t0
+            return summary
+
+        progress("parseo")
+        with span("parse_log", bytes=os.path.getsize(log_path)):
+            if cpu_pool:
+                sections = cpu_pool.submit(load_log_sections, log_path).result()
+            else:
+                sections = load_log_sections(log_path)
+        with span("context"):
+            reports_dir = find_reports_dir(log_path)
+            ctx = build_run_context(sections, reports_dir)
+            attach_history(ctx, serial, log_path, sections, reports_dir)
+
+        analyses, verdicts, complete = analyze_and_deliver(journal, thread_id, sections, ctx, concurrency,
+                                                           on_progress)
+        print_compaction(serial, ctx)
+        progress("pdf")
+        summary["status"] = m["status"] = finish_run(journal, thread_id, log_path, analyses, verdicts,
+                                                     complete, cpu_pool, ctx)
+    summary["elapsed"] = time.monotonic() - t0
+    return summary
+
+def run_batch(root, concurrency=LLM_CONCURRENCY, machines=BATCH_MACHINES, resume=True):
+    """
+    Procesa todos los *_final.txt bajo `root` a la vez. Las llamadas al LLM
+    comparten un semáforo global y las de Discord los buckets de rate limit,
+    así que una máquina lenta no bloquea al resto.
+    """
+    logs = find_fleet_logs(root)
+    if not logs:
+        print(f"No se encontró ningún archivo de log final en '{root}'.")
+        return []
+    print(f"Se van a procesar {len(logs)} máquinas:")
+    for log_path, reports_dir in logs:
+        print(f"  - {log_path}" + ("" if reports_dir else " (sin carpeta _reports)"))
+
+    summaries = []
+    with ProcessPoolExecutor() as cpu_pool, ThreadPoolExecutor(max_workers=max(1, machines)) as pool:
+        # Arranca los procesos antes de crear hilos (fork desde un proceso con hilos no es seguro)
+        cpu_pool.submit(os.getpid).result()
+        futures = {pool.submit(process_log, log_path, concurrency, cpu_pool, resume): log_path for log_path, _ in logs}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"Error procesando {futures[future]}:", e)
+                summary = {"serial": serial_from_log_path(futures[future]), "status": "ERROR", "elapsed": 0.0}
+            print(f"[{summary['status']}] {summary['serial']} ({summary['elapsed']:.1f} s)")
+            summaries.append(summary)
+
+    print("\nResumen de la flota:")
+    for summary in sorted(summaries, key=lambda x: x["serial"]):
+        print(f"  {summary['serial']:<40} {summary['status']:<6} {summary['elapsed']:>8.1f} s")
+    return summaries
+
+# === Modo vigilancia (--watch) ===
+def script_order(config_text):
+    """
+    Orden de las secciones en la ejecución según la lista de scripts del
+    bloque "Configuracion" ("3. Geekbench GPU", "5. MprimeDesktop -> ...").
+    Las secciones que no están en la lista van al final, en el orden de
+    SECTION_MARKERS.
+    """
+    names = sorted(((re.sub(r"[^a-z0-9]", "", b.lower()), b) for b in SECTION_MARKERS),
+                   key=lambda n: -len(n[0]))
+    order = ["Configuracion", "Valores"]
+    for line in config_text.splitlines():
+        m = re.match(r"\s*\d+\.\s*(.+?)\s*(?:->.*)?$", line)
+        if not m:
+            continue
+        script = re.sub(r"[^a-z0-9]", "", m.group(1).lower())
+        bench = next((b for n, b in names if script.startswith(n)), None)
+        if bench and bench not in order:
+            order.append(bench)
+    return order + [b for b in SECTION_MARKERS if b not in order]
+
+class LiveRun:
+    """
+    Sigue un log que aún está creciendo. Solo lee los bytes nuevos (líneas
+    completas) y mantiene los rangos de cada sección. Una sección se da por
+    cerrada cuando empieza una etapa posterior de la lista de "Configuracion";
+    entonces se analiza y se publica sin esperar al final. Al
+    terminar la ejecución se revisan las secciones (p. ej. con los datos de
+    _reports, que se copian al final) y el PDF se monta con lo ya calculado.
+    El diario no se abre hasta tener JOURNAL_PREFIX_BYTES (o la sección
+    Valores cerrada): antes el log solo contiene la configuración, que es
+    igual en todas las repeticiones.
+    El texto de las secciones cerradas, el contexto y las huellas se guardan
+    entre lecturas: solo se decodifican las secciones que acaban de cerrarse y
+    una lectura sin cambios no vuelve a consultar el histórico.
+    """
+    def __init__(self, log_path, concurrency=LLM_CONCURRENCY, resume=True):
+        self.log_path = log_path
+        self.serial = serial_from_log_path(log_path)
+        self.concurrency = concurrency
+        self.resume = resume
+        self.journal = None
+        self.thread_id = None
+        self.spans = {b: [] for b in SECTION_MARKERS}
+        self.current = None           # sección abierta (la última vista)
+        self.order = None             # orden de las etapas (script_order)
+        self.file_id = None           # (dispositivo, inodo) del log que se está leyendo
+        self.final_state = None       # estado del fichero al terminar (file_state)
+        self.texts = {}               # sección cerrada -> texto decodificado
+        self.decoded = {}             # sección -> rangos con los que se decodificó
+        self.keys = {}                # sección -> section_input_key con el contexto actual
+        self.ctx = None
+        self.ctx_reports = None       # carpeta de reports con la que se construyó self.ctx
+        self.retry = False            # la última entrega quedó incompleta
+        self.scanned = 0              # bytes del log ya procesados (líneas completas)
+        self.last_growth = time.monotonic()
+        self.ended = False
+        self.finished = False
+        self.status = None
+        self.t0 = time.monotonic()
+
+    def _read_new_lines(self):
+        """
+        Incorpora las líneas completas añadidas desde la última lectura.
+        Devuelve True si el log ha crecido.
+        """
+        state = self.file_state()
+        size = state[2]
+        if size < self.scanned or (self.file_id is not None and state[:2] != self.file_id):
+            # El diario decide luego, por el prefijo, si es la misma ejecución
+            print(f"El log de {self.serial} se ha sustituido o truncado; se vuelve a leer desde el principio.")
+            self.__init__(self.log_path, self.concurrency, self.resume)
+            return False
+        self.file_id = state[:2]
+        if size <= self.scanned:
+            return False
+        with open(self.log_path, "rb") as f:
+            f.seek(self.scanned)
+            chunk = f.read(size - self.scanned)
+        cut = chunk.rfind(b"\n") + 1
+        if cut == 0:
+            return False
+        chunk = chunk[:cut]
+        base = self.scanned
+        new_spans = find_section_spans(chunk)
+        starts = sorted((s, b) for b, ranges in new_spans.items() for s, _ in ranges)
+        if self.current is not None:
+            # Lo anterior al primer marcador nuevo pertenece a la sección abierta
+            s, _ = self.spans[self.current][-1]
+            self.spans[self.current][-1] = (s, base + (starts[0][0] if starts else len(chunk)))
+        for bench, ranges in new_spans.items():
+            self.spans[bench].extend((base + s, base + e) for s, e in ranges)
+        if starts:
+            self.current = starts[-1][1]
+        self.scanned = base + cut
+        if RUN_END_MARKER.encode("utf-8") in chunk:
+            self.ended = True
+        return True
+
+    def file_state(self):
+        """(dispositivo, inodo, tamaño, mtime) del log."""
+        st = os.stat(self.log_path)
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+    def changed_since_finish(self):
+        """True si el log se ha reescrito o sustituido después de terminar."""
+        try:
+            return self.finished and self.file_state() != self.final_state
+        except OSError:
+            return False
+
+    def _load_order(self):
+        """Lee el orden de las etapas en cuanto el bloque "Configuracion" está completo."""
+        if self.order is not None or not any(r for b, r in self.spans.items() if b != "Configuracion"):
+            return
+        config = ""
+        if self.spans["Configuracion"]:
+            with open(self.log_path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    config = sections_from_spans(mm, {"Configuracion": self.spans["Configuracion"]})["Configuracion"]
+        self.order = script_order(config)
+
+    def closed_sections(self):
+        """
+        Secciones cuyo texto ya no va a cambiar, en orden de aparición. Una
+        sección se cierra cuando una etapa posterior en self.order empieza
+        después de su último marcador. En los logs multi-GPU las líneas de
+        Geekbench se intercalan con las de GeekbenchGPU: como Geekbench ya
+        había aparecido antes, GeekbenchGPU sigue abierta hasta Anchobanda.
+        """
+        rank = {b: i for i, b in enumerate(self.order or SECTION_MARKERS)}
+        first = {b: r[0][0] for b, r in self.spans.items() if r}
+        last = {b: r[-1][0] for b, r in self.spans.items() if r}
+        closed = [b for b in last
+                  if self.ended or any(rank[c] > rank[b] and first[c] > last[b] for c in first)]
+        return sorted(closed, key=lambda b: first[b])
+
+    def poll(self):
+        """
+        Un paso del seguimiento: lee lo nuevo, analiza y publica las secciones
+        cerradas y, si la ejecución terminó, genera y envía el PDF.
+        """
+        if self.finished:
+            return
+        with span("tail_read", serial=self.serial) as m:
+            grew = self._read_new_lines()
+            m["scanned"] = self.scanned
+        if grew:
+            self.last_growth = time.monotonic()
+            self._load_order()
+        elif self.scanned and time.monotonic() - self.last_growth > WATCH_IDLE_TIMEOUT:
+            print(f"El log de {self.serial} no crece desde hace {WATCH_IDLE_TIMEOUT} s; se da por terminado.")
+            self.ended = True
+
+        closed = self.closed_sections()
+        if self.journal is None:
+            if not self.scanned or (self.scanned < JOURNAL_PREFIX_BYTES and not self.ended
+                                    and "Valores" not in closed):
+                return
+            state = self.file_state()
+            self.journal = RunJournal.load(self.log_path, self.resume)
+            if self.journal.is_finished(file_sha256(self.log_path)):
+                print(f"{self.serial} ya se procesó por completo.")
+                self.finished, self.status, self.final_state = True, self.journal.data["status"], state
+                return
+            self.journal.reopen()
+        if not closed:
+            return
+        fresh = [b for b in closed if self.decoded.get(b) != self.spans[b]]
+        if not fresh and not self.retry and not self.ended:
+            return
+        if fresh:
+            with open(self.log_path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    decoded = sections_from_spans(mm, {b: self.spans[b] for b in fresh})
+            for b in fresh:
+                self.texts[b] = decoded[b]
+                self.decoded[b] = list(self.spans[b])
+        reports_dir = find_reports_dir(self.log_path) if self.ended else None
+        prev = self.ctx or {}
+        if fresh or self.ctx is None or reports_dir != self.ctx_reports:
+            sections = {b: self.texts.get(b, "") for b in SECTION_MARKERS}
+            with span("context", serial=self.serial):
+                self.ctx = build_run_context(sections, reports_dir)
+                attach_history(self.ctx, self.serial, self.log_path, sections, reports_dir)
+            self.ctx_reports = reports_dir
+        ctx = self.ctx
+        # La huella solo cambia con el texto o con los datos del contexto de los que depende
+        for b in closed:
+            if (b in fresh or b not in self.keys
+                    or any(ctx.get(k) != prev.get(k) for k in SECTION_CONTEXT_DEPS.get(b, ()))):
+                self.keys[b] = section_input_key(b, self.texts[b], ctx)
+        pending = {b: self.texts[b] for b in closed
+                   if self.texts[b].strip() and not self.journal.is_delivered(b, self.keys[b])}
+        if not pending and not self.ended:
+            self.retry = False
+            return
+        if self.thread_id is None:
+            self.thread_id = open_thread(self.journal)
+            if not self.thread_id:
+                self.retry = True
+                return
+        with span_labels(serial=self.serial):
+            _, _, complete = analyze_and_deliver(self.journal, self.thread_id, pending, ctx, self.concurrency)
+        self.retry = not complete
+        if pending:
+            print(f"[{self.serial}] " + (f"Publicado: {', '.join(pending)}." if complete else
+                                         "Entrega incompleta; se reintentará en la siguiente lectura."))
+        if not self.ended or not complete:
+            return
+        print_compaction(self.serial, ctx)
+        state = self.file_state()
+        analyses, verdicts = self.journal.analyses()
+        order = [b for b in closed if b in analyses]
+        analyses = {b: analyses[b] for b in order}
+        verdicts = {b: verdicts[b] for b in order}
+        with span_labels(serial=self.serial):
+            self.status = finish_run(self.journal, self.thread_id, self.log_path, analyses, verdicts, True,
+                                     ctx=ctx)
+        if self.status != "ERROR":
+            self.finished, self.final_state = True, state
+            print(f"[{self.status}] {self.serial}: informe completo "
+                  f"({time.monotonic() - self.t0:.1f} s desde que se empezó a seguir el log).")
+
+def watch_logs(root, concurrency=LLM_CONCURRENCY, machines=BATCH_MACHINES, resume=True, once=False):
+    """
+    Modo demonio: cada WATCH_POLL_INTERVAL segundos busca *_final.txt bajo
+    `root` y avanza el seguimiento de cada uno. Con `once` termina cuando
+    todas las máquinas vistas han acabado. Un log terminado que se reescribe
+    (otra ejecución en la misma máquina) se vuelve a seguir.
+    """
+    runs = {}
+    with ThreadPoolExecutor(max_workers=max(1, machines)) as pool:
+        while True:
+            for log_path, _ in find_fleet_logs(root):
+                if log_path in runs and runs[log_path].changed_since_finish():
+                    print(f"{log_path} ha cambiado después de terminar.")
+                    del runs[log_path]
+                if log_path not in runs:
+                    print(f"Siguiendo {log_path}")
+                    runs[log_path] = LiveRun(log_path, concurrency, resume)
+            active = [r for r in runs.values() if not r.finished]
+            for run, future in [(r, pool.submit(r.poll)) for r in active]:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error siguiendo {run.log_path}:", e)
+            if once and runs and all(r.finished for r in runs.values()):
+                return runs
+            time.sleep(WATCH_POLL_INTERVAL)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analiza un log *_final.txt y publica los resultados en Discord.")
+    parser.add_argument("--concurrency", type=int, default=LLM_CONCURRENCY,
+                        help="secciones analizadas a la vez por el LLM (por defecto OLLAMA_NUM_PARALLEL o 4)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ignora la caché en disco y repite todas las llamadas al LLM")
+    parser.add_argument("--batch", metavar="DIR",
+                        help="procesa todos los *_final.txt bajo DIR en paralelo")
+    parser.add_argument("--watch", metavar="DIR", nargs="?", const=".",
+                        help="modo demonio: sigue los *_final.txt de DIR (por defecto el actual) "
+                             "mientras se escriben y publica cada sección al cerrarse")
+    parser.add_argument("--profile", metavar="FICHERO",
+                        help="guarda los tiempos de cada etapa y sección (JSON, o texto de Prometheus si acaba en .prom)")
+    parser.add_argument("--triage-model", metavar="MODELO", default=TRIAGE_MODEL,
+                        help="modelo pequeño que revisa cada sección antes; solo las sospechosas "
+                             f"se analizan con {MODEL_NAME} (por defecto $AGENT_TRIAGE_MODEL)")
+    parser.add_argument("--no-history", action="store_true",
+                        help="no guarda la ejecución en el histórico SQLite ni compara con la flota")
+    parser.add_argument("--import-reference", metavar="CSV",
+                        help="importa datos de referencia (columnas metric,model,value[,source]) y termina")
+    parser.add_argument("--fresh", action="store_true",
+                        help="ignora el diario de ejecución y empieza de cero (nuevo hilo)")
+    parser.add_argument("--machines", type=int, default=BATCH_MACHINES,
+                        help=f"máquinas procesadas a la vez en modo --batch (por defecto {BATCH_MACHINES})")
+    return parser.parse_args(argv)
+
+def main():
+    global _cache_enabled, _llm_slots, _profiler, _history_enabled, TRIAGE_MODEL
+    args = parse_args()
+    _cache_enabled = not args.no_cache
+    TRIAGE_MODEL = args.triage_model
+    _history_enabled = not args.no_history
+    if args.import_reference:
+        count = import_reference_data(args.import_reference)
+        print(f"Importadas {count} referencias en {HISTORY_DB_PATH}.")
+        return
+    _llm_slots = threading.BoundedSemaphore(max(1, args.concurrency))
+    if args.profile:
+        _profiler = Profiler()
+    try:
+        run(args)
+    finally:
+        if _profiler is not None:
+            _profiler.write(args.profile)
+            print(f"Métricas guardadas en {args.profile}")
+
+def run(args):
+    if args.watch:
+        preload_models()
+        try:
+            watch_logs(args.watch, args.concurrency, args.machines, resume=not args.fresh)
+        except KeyboardInterrupt:
+            print("Vigilancia detenida.")
+        return
+
+    if args.batch:
+        preload_models()
+        summaries = run_batch(args.batch, args.concurrency, args.machines, resume=not args.fresh)
+        if not summaries or any(x["status"] == "ERROR" for x in summaries):
+            sys.exit(1)
+        return
+
+    log_path = find_log_file()
+    if log_path is None:
+        sys.exit(1)
+    if not os.path.exists(log_path):
+        print(f"No existe '{log_path}'."); sys.exit(1)
+
+    preload_models()
+    summary = process_log(log_path, args.concurrency, resume=not args.fresh)
+    if summary["status"] == "ERROR":
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,32 @@
+"""
+split_message: ningún trozo pasa del límite de Discord y los bloques ``` quedan equilibrados.
+"""
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discordagent
+from discordagent import split_message
+
+LIMIT = discordagent.DISCORD_MESSAGE_LIMIT
+
+def test_opening_fence_at_chunk_end_stays_within_limit():
+    chunks = split_message("a" * 1995 + "\n```\ncode\n```", LIMIT)
+    assert all(len(c) <= LIMIT for c in chunks)
+    assert chunks[-1].startswith("```") and "code" in chunks[-1]
+
+def test_only_fences_produce_no_chunks():
+    assert split_message("```", LIMIT) == []
+    assert split_message("```py\n```", LIMIT) == []
+
+def test_random_content_respects_limit_and_fences():
+    rng = random.Random(0)
+    options = ["```", "```py", "", "texto corto"]
+    for _ in range(2000):
+        lines = [rng.choice(options + ["x" * rng.randint(0, 2500)]) for _ in range(rng.randint(1, 40))]
+        for chunk in split_message("\n".join(lines), LIMIT):
+            assert len(chunk) <= LIMIT
+            fences = [l for l in chunk.split("\n") if l.strip().startswith("```")]
+            assert len(fences) % 2 == 0
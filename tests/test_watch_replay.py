@@ -0,0 +1,110 @@
+"""
+Modo vigilancia: un log que crece poco a poco publica cada sección una sola vez.
+"""
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discordagent
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOGS = [
+    os.path.join(ROOT, "AzkenOS Keepcoding", "AgentOS-Keepcoding_final.txt"),
+    os.path.join(ROOT, "AzkenOS Keepcoding 3", "AgentOS-Keepcoding3_final.txt"),
+]
+
+@pytest.fixture
+def delivered(monkeypatch):
+    """Sustituye el LLM y Discord; devuelve la lista de (sección, actualización) publicadas."""
+    posts = []
+    threads = []
+
+    def fake_deliver(thread_id, bench, analysis, abnormal, posted=None, on_post=None, update=False):
+        posts.append((bench, update))
+        return [len(posts)]
+
+    monkeypatch.setattr(discordagent, "_history_enabled", False)
+    monkeypatch.setattr(discordagent, "analyze_section", lambda bench, text, ctx: (f"{bench}: ok", False))
+    monkeypatch.setattr(discordagent, "deliver_section", fake_deliver)
+    monkeypatch.setattr(discordagent, "create_discord_thread",
+                        lambda channel, name: threads.append(name) or f"hilo-{len(threads)}")
+    monkeypatch.setattr(discordagent, "finish_run", lambda *a, **k: "OK")
+    return posts
+
+def replay(src, dst, step=5, resume=False):
+    """Copia `src` en `dst` de `step` en `step` líneas, llamando a poll tras cada escritura."""
+    if isinstance(src, bytes):
+        data = src
+    else:
+        with open(src, "rb") as f:
+            data = f.read()
+    lines = data.splitlines(keepends=True)
+    run = None
+    with open(dst, "wb") as out:
+        for i in range(0, len(lines), step):
+            out.write(b"".join(lines[i:i + step]))
+            out.flush()
+            run = run or discordagent.LiveRun(dst, concurrency=1, resume=resume)
+            run.poll()
+    run.ended = True
+    run.poll()
+    return run
+
+@pytest.mark.parametrize("src", LOGS, ids=os.path.basename)
+def test_each_section_delivered_once(src, tmp_path, delivered):
+    run = replay(src, str(tmp_path / os.path.basename(src)))
+    assert run.finished
+    expected = [b for b, text in discordagent.load_log_sections(src).items() if text.strip()]
+    assert sorted(b for b, _ in delivered) == sorted(expected)
+    assert not any(update for _, update in delivered)
+
+def test_script_order_follows_config_list():
+    config = ("Se van a ejecutar los siguientes scripts en secuencia con los siguientes parámetros:\n"
+              "1. Mprime -> num_cpus: 2\n2. Geekbench GPU\n3. AnchoBanda\n4. GPU-BURN -> clock base: 1395 MHz\n")
+    order = discordagent.script_order(config)
+    assert order[:6] == ["Configuracion", "Valores", "Mprime", "GeekbenchGPU", "Anchobanda", "GPU-BURN"]
+    assert sorted(order) == sorted(discordagent.SECTION_MARKERS)
+
+def test_rerun_with_same_config_gets_its_own_journal(tmp_path, delivered):
+    dst = str(tmp_path / "AgentOS-Keepcoding_final.txt")
+    with open(LOGS[0], "rb") as f:
+        first = f.read()
+    # Otra ejecución en la misma máquina: la configuración es idéntica y cambian los valores
+    lines = first.splitlines(keepends=True)
+    second = b"".join(lines[:20] + [b"- Temperatura CPU : 41 C\n"] + lines[20:])
+
+    run = replay(first, dst, resume=True)
+    assert run.finished and run.journal.data["thread_id"] == "hilo-1"
+    assert not run.changed_since_finish()
+
+    rerun = replay(second, dst, resume=True)
+    assert run.changed_since_finish()
+    assert rerun.finished and rerun.journal.data["thread_id"] == "hilo-2"
+
+def test_closed_sections_are_decoded_once(tmp_path, delivered, monkeypatch):
+    decoded = Counter()
+    contexts = []
+    from_spans, attach = discordagent.sections_from_spans, discordagent.attach_history
+
+    def counting_from_spans(buf, spans):
+        decoded.update(b for b, ranges in spans.items() if ranges)
+        return from_spans(buf, spans)
+
+    def counting_attach(ctx, *args, **kwargs):
+        contexts.append(ctx)
+        return attach(ctx, *args, **kwargs)
+
+    monkeypatch.setattr(discordagent, "sections_from_spans", counting_from_spans)
+    monkeypatch.setattr(discordagent, "attach_history", counting_attach)
+    src = LOGS[1]
+    run = replay(src, str(tmp_path / os.path.basename(src)))
+    assert run.finished
+    # Configuracion se lee una vez más para el orden de las etapas
+    assert decoded.pop("Configuracion") == 2
+    assert set(decoded.values()) == {1}
+    # Un contexto por cada lectura que cierra secciones, más el del final con los reports
+    assert len(contexts) <= len(decoded) + 2